@@ -0,0 +1,359 @@
+import asyncio
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+import config
+from telemetry import LLM_CALLS, LLM_SECONDS, LLM_TOKENS, QUEUE_DEPTH
+
+# Errors worth another attempt; anything else (bad request, auth) is raised as is
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+LATENCY_WINDOW = 200
+# Samples needed before the p95 replaces the configured hedge delay
+MIN_HEDGE_SAMPLES = 20
+
+
+class LLMUnavailable(Exception):
+    """The provider is failing: the circuit is open or every attempt failed"""
+
+
+class CallPolicy:
+    """Deadline, retry and hedging settings for one kind of LLM call"""
+
+    def __init__(self, timeout, retries, hedge=False):
+        self.timeout = timeout
+        self.retries = retries
+        self.hedge = hedge
+
+
+POLICIES = {
+    # Vision extraction: long, expensive, never duplicated
+    "extraction": CallPolicy(config.LLM_EXTRACTION_TIMEOUT, config.LLM_MAX_RETRIES),
+    "labels": CallPolicy(config.LLM_CONVERSATION_TIMEOUT, config.LLM_MAX_RETRIES),
+    # Short conversational calls sit on the user's critical path: hedge them
+    "conversation": CallPolicy(config.LLM_CONVERSATION_TIMEOUT, config.LLM_MAX_RETRIES, hedge=True),
+}
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and rejects calls for
+    `cooldown` seconds; then lets one trial call through (half-open) and
+    closes again when it succeeds. A trial that never reports back (e.g.
+    cancelled) is replaced after another cooldown.
+    """
+
+    def __init__(self, threshold=None, cooldown=None):
+        self.threshold = threshold or config.LLM_BREAKER_FAILURES
+        self.cooldown = cooldown or config.LLM_BREAKER_COOLDOWN
+        self.failures = 0
+        self.opened_at = None
+        self._trial_at = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        now = time.monotonic()
+        if state == "half-open" and (self._trial_at is None or now - self._trial_at >= self.cooldown):
+            self._trial_at = now
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_at = None
+        if self.failures >= self.threshold or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+
+
+class UsageStats:
+    """Calls, token counts and latency per (call type, prompt version)"""
+
+    def __init__(self):
+        self._entries = {}
+
+    def record(self, call_type, prompt, usage, latency):
+        LLM_CALLS.labels(call_type, "ok").inc()
+        LLM_SECONDS.labels(call_type).observe(latency)
+        entry = self._entries.setdefault((call_type, prompt or ""), {
+            "calls": 0, "unreported": 0, "input_tokens": 0, "cached_tokens": 0, "output_tokens": 0, "latency": 0.0,
+        })
+        entry["calls"] += 1
+        entry["latency"] += latency
+        if usage is None:
+            # Provider sent no usage block (e.g. streams without include_usage)
+            entry["unreported"] += 1
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        tokens = {
+            "input": usage.prompt_tokens or 0,
+            "cached": getattr(details, "cached_tokens", None) or 0,
+            "output": usage.completion_tokens or 0,
+        }
+        for kind, count in tokens.items():
+            entry[f"{kind}_tokens"] += count
+            LLM_TOKENS.labels(call_type, kind).inc(count)
+
+    def summary(self):
+        return [
+            dict(entry, call_type=call_type, prompt=prompt, mean_latency=entry["latency"] / entry["calls"])
+            for (call_type, prompt), entry in sorted(self._entries.items())
+        ]
+
+
+class LlamaClient:
+    """
+    Async Llama API client shared by every request in a worker.
+
+    Built once in the app lifespan; FormConversation and FormExtraction borrow
+    it so completions reuse pooled keep-alive connections and never block the
+    event loop. A semaphore caps the number of in-flight completions.
+
+    Every call runs under the policy for its call_type: a per-attempt deadline
+    and retries with jittered exponential backoff; conversational calls also
+    get a hedged duplicate once they outlast the recent p95 latency, and the
+    first reply wins. A circuit breaker fails calls fast with LLMUnavailable
+    while the provider keeps failing, so callers can degrade instead of
+    holding a worker. Token usage and latency of successful calls are tallied
+    per call type and `prompt` version.
+    """
+
+    def __init__(
+        self,
+        api_key=None,
+        base_url=None,
+        model=None,
+        max_connections=None,
+        max_keepalive=None,
+        max_concurrency=None,
+    ):
+        self.model = model or config.LLAMA_MODEL
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections or config.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=max_keepalive or config.LLM_MAX_KEEPALIVE,
+                keepalive_expiry=config.LLM_KEEPALIVE_EXPIRY,
+            ),
+        )
+        self.client = AsyncOpenAI(
+            api_key=api_key or config.LLAMA_API_KEY,
+            base_url=base_url or config.LLAMA_BASE_URL,
+            http_client=self.http_client,
+            # Deadlines and retries are handled here, per call type
+            max_retries=0,
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency or config.LLM_MAX_CONCURRENCY)
+        self.breaker = CircuitBreaker()
+        self._latencies = {name: deque(maxlen=LATENCY_WINDOW) for name in POLICIES}
+        self.counters = {"calls": 0, "retries": 0, "timeouts": 0, "hedges": 0, "hedge_wins": 0, "rejected": 0}
+        self.usage = UsageStats()
+
+    def _p95(self, call_type):
+        samples = sorted(self._latencies[call_type])
+        if len(samples) < MIN_HEDGE_SAMPLES:
+            return None
+        return samples[int(len(samples) * 0.95) - 1]
+
+    def _hedge_delay(self, call_type):
+        p95 = self._p95(call_type)
+        return max(p95, config.LLM_HEDGE_MIN_DELAY) if p95 is not None else config.LLM_HEDGE_DELAY
+
+    def _backoff(self, attempt):
+        # Full jitter keeps retries from many workers from arriving in lockstep
+        return random.uniform(0, config.LLM_RETRY_BASE_DELAY * 2 ** attempt)
+
+    @asynccontextmanager
+    async def _slot(self):
+        """Hold one of the max_concurrency completion slots, reporting waiting and in-flight calls"""
+        waiting = QUEUE_DEPTH.labels("llm_waiting")
+        waiting.inc()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            waiting.dec()
+        in_flight = QUEUE_DEPTH.labels("llm_in_flight")
+        in_flight.inc()
+        try:
+            yield
+        finally:
+            in_flight.dec()
+            self._semaphore.release()
+
+    async def _attempt(self, call_type, timeout, kwargs):
+        async with self._slot():
+            start = time.monotonic()
+            completion = await asyncio.wait_for(self.client.chat.completions.create(**kwargs), timeout)
+            self._latencies[call_type].append(time.monotonic() - start)
+            return completion
+
+    async def _hedged(self, call_type, timeout, kwargs):
+        """Run one attempt, adding a duplicate if it is slower than the hedge delay; first success wins"""
+        primary = asyncio.create_task(self._attempt(call_type, timeout, kwargs))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self._hedge_delay(call_type))
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        if done:
+            return primary.result()
+
+        self.counters["hedges"] += 1
+        hedge = asyncio.create_task(self._attempt(call_type, timeout, kwargs))
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def chat(self, messages, call_type="conversation", prompt=None, **kwargs):
+        """
+        Run a chat completion against the configured model under the call_type
+        policy; `prompt` is the PromptTemplate version the usage is booked to.
+        """
+        policy = POLICIES[call_type]
+        kwargs = dict(kwargs, model=kwargs.get("model", self.model), messages=messages)
+        self.counters["calls"] += 1
+        start = time.monotonic()
+        last_error = None
+        for attempt in range(policy.retries + 1):
+            if not self.breaker.allow():
+                self.counters["rejected"] += 1
+                LLM_CALLS.labels(call_type, "rejected").inc()
+                raise LLMUnavailable("LLM provider circuit is open") from last_error
+            if attempt:
+                self.counters["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt - 1))
+            try:
+                if policy.hedge:
+                    completion = await self._hedged(call_type, policy.timeout, kwargs)
+                else:
+                    completion = await self._attempt(call_type, policy.timeout, kwargs)
+            except RETRYABLE_ERRORS as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.counters["timeouts"] += 1
+                self.breaker.record_failure()
+                last_error = e
+                continue
+            except openai.APIStatusError:
+                # The provider answered; the request itself was wrong
+                self.breaker.record_success()
+                LLM_CALLS.labels(call_type, "error").inc()
+                raise
+            self.breaker.record_success()
+            self.usage.record(call_type, prompt, completion.usage, time.monotonic() - start)
+            return completion
+        LLM_CALLS.labels(call_type, "failed").inc()
+        raise LLMUnavailable(f"LLM call failed after {policy.retries + 1} attempts: {last_error!r}") from last_error
+
+    async def chat_stream(self, messages, call_type="conversation", prompt=None, **kwargs):
+        """
+        Run a streaming chat completion, yielding content deltas as they arrive.
+        The policy timeout applies to the wait for each chunk; attempts are
+        retried only until the first delta has been yielded.
+        """
+        policy = POLICIES[call_type]
+        model = kwargs.pop("model", self.model)
+        if config.LLM_STREAM_USAGE:
+            # The final chunk then carries the token usage of the whole reply
+            kwargs.setdefault("stream_options", {"include_usage": True})
+        self.counters["calls"] += 1
+        start = time.monotonic()
+        last_error = None
+        for attempt in range(policy.retries + 1):
+            if not self.breaker.allow():
+                self.counters["rejected"] += 1
+                LLM_CALLS.labels(call_type, "rejected").inc()
+                raise LLMUnavailable("LLM provider circuit is open") from last_error
+            if attempt:
+                self.counters["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt - 1))
+            yielded = False
+            usage = None
+            try:
+                async with self._slot():
+                    stream = await asyncio.wait_for(
+                        self.client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            stream=True,
+                            **kwargs,
+                        ),
+                        policy.timeout,
+                    )
+                    try:
+                        chunks = stream.__aiter__()
+                        while True:
+                            try:
+                                chunk = await asyncio.wait_for(chunks.__anext__(), policy.timeout)
+                            except StopAsyncIteration:
+                                break
+                            if getattr(chunk, "usage", None):
+                                usage = chunk.usage
+                            if chunk.choices and chunk.choices[0].delta.content:
+                                yielded = True
+                                yield chunk.choices[0].delta.content
+                    finally:
+                        await stream.close()
+            except RETRYABLE_ERRORS as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.counters["timeouts"] += 1
+                self.breaker.record_failure()
+                if yielded:
+                    LLM_CALLS.labels(call_type, "failed").inc()
+                    raise LLMUnavailable(f"LLM stream failed midway: {e!r}") from e
+                last_error = e
+                continue
+            except openai.APIStatusError:
+                self.breaker.record_success()
+                LLM_CALLS.labels(call_type, "error").inc()
+                raise
+            self.breaker.record_success()
+            self.usage.record(call_type, prompt, usage, time.monotonic() - start)
+            return
+        LLM_CALLS.labels(call_type, "failed").inc()
+        raise LLMUnavailable(f"LLM stream failed after {policy.retries + 1} attempts: {last_error!r}") from last_error
+
+    def stats(self):
+        return dict(
+            self.counters,
+            breaker=self.breaker.state,
+            p95={name: self._p95(name) for name in POLICIES},
+            usage=self.usage.summary(),
+        )
+
+    async def aclose(self):
+        await self.client.close()
@@ -1,50 +1,69 @@
-from openai import OpenAI
-import os
-from dotenv import load_dotenv
 import json
+import logging
 
+import prompts
+from ai_client import LLMUnavailable
+from answer_rules import field_kind, radio_options, validate_answer_locally
+from telemetry import ANSWER_VALIDATIONS
 
-class FormConversation:
-    def __init__(self):
-        load_dotenv()
-        self.client = OpenAI(
-            api_key=os.getenv("LLAMA_API_KEY"),
-            base_url="https://api.llama.com/compat/v1/"
-        )
-
-    def get_next_field_prompt(self, field, last_response):
-        prompt = f"""
-            You are a super friendly and helpful AI form assistant. You're guiding a user step-by-step through filling out a form they uploaded. 
+log = logging.getLogger(__name__)
 
-            Your job is to turn the next form field into a natural, polite, and easy-to-understand question that can be asked in a chat conversation.
 
-            Here’s the next field to ask the user about:
-            - Field Label: "{field['label']}"
-            - Field Context: "{field['context']}"
-            - Last Response: "{last_response}"
+def template_question(field):
+    """Plain question built from the field label, used when the LLM is unavailable"""
+    label = field.get("normalized_label") or field.get("label") or field.get("inputfield", "this field")
+    kind = field_kind(field)
+    if kind == "checkbox":
+        return f'Should "{label}" be checked? (yes/no)'
+    if kind == "radio" and radio_options(field):
+        return f'Which applies for "{label}"? ({" / ".join(radio_options(field))})'
+    if kind == "date":
+        return f'What is the date for "{label}"? (MM/DD/YYYY)'
+    return f'What should I enter for "{label}"?'
 
-            Generate a short and friendly question based on the field label and context. Avoid repeating the field label verbatim — instead, make it conversational. For example:
-            - Label: "Date of Birth" → Question: "What’s your date of birth?"
-            - Label: "Employer" under context "Current job information" → Question: "Who do you currently work for?"
-            - Label: "Phone" → Question: "What’s the best phone number to reach you at?"
 
-            If the user's previous question or answer was in a different language, continue in that langugage.
-
-            Respond with just the question.
-        """
+class FormConversation:
+    def __init__(self, llm):
+        self.llm = llm
 
-        completion = self.client.chat.completions.create(
-            model="Llama-4-Maverick-17B-128E-Instruct-FP8",
-            messages=[
-                {
-                    "role": "developer",
-                    "content": prompt
-                }
-            ]
+    def _next_field_prompt_messages(self, field, last_response):
+        return prompts.NEXT_QUESTION.messages(
+            label=field['label'], context=field['context'], last_response=last_response
         )
 
+    async def get_next_field_prompt(self, field, last_response):
+        try:
+            completion = await self.llm.chat(
+                messages=self._next_field_prompt_messages(field, last_response),
+                prompt=prompts.NEXT_QUESTION.version,
+            )
+        except LLMUnavailable as e:
+            log.warning("Falling back to a template question", extra={"error": str(e)})
+            return template_question(field)
+
         return completion.choices[0].message.content.strip()
 
+    async def stream_next_field_prompt(self, field, last_response):
+        """Same question as get_next_field_prompt, yielded token by token"""
+        leading = True
+        try:
+            async for text in self.llm.chat_stream(
+                messages=self._next_field_prompt_messages(field, last_response),
+                prompt=prompts.NEXT_QUESTION.version,
+            ):
+                # Mirror the .strip() of the non-streaming variant on the leading edge
+                if leading:
+                    text = text.lstrip()
+                    if not text:
+                        continue
+                    leading = False
+                yield text
+        except LLMUnavailable as e:
+            if not leading:
+                raise
+            log.warning("Falling back to a template question", extra={"error": str(e)})
+            yield template_question(field)
+
     
         
     def _parse_llama_response(self, response_text):
@@ -64,85 +83,98 @@ class FormConversation:
             raise ValueError(f"Failed to parse Llama API response: {str(e)}")
     
 
-    def get_next_field_answer_prompt(self, field, answer, last_response):
-            context = f"""
-                You are a form validation assistant helping users fill out structured documents.
-
-                Your task is to evaluate this response and return a JSON object with the following fields:
-
-                - "answer": string — the user's provided answer.
-                - "is_valid": boolean — is this a valid input for the field?
-                - "invalid_reason": string — if invalid, explain briefly why (empty if valid).
-                - "is_followup": boolean — does the user seem confused or require clarification?
-                - "followup_prompt": string — if follow-up is needed, provide a clear next question or instruction (empty if not).
+    async def get_next_field_answer_prompt(self, field, answer, last_response):
+        completion = await self.llm.chat(
+            messages=prompts.ANSWER_VALIDATION.messages(
+                label=field['label'], context=field['context'], answer=answer, last_response=last_response
+            ),
+            prompt=prompts.ANSWER_VALIDATION.version,
+        )
 
-                ## Guidelines:
-                - If the answer format is incorrect or incomplete, mark it as invalid and give a reason.
-                - If the user expresses confusion (e.g. “I'm not sure” or asks a question), mark is_followup as true and provide helpful guidance.
-                - Be concise, direct, and only return a **valid JSON object** as shown in the examples below.
+        log.debug("Validation reply", extra={"reply": completion.choices[0].message.content})
+        return self._parse_llama_response(completion.choices[0].message.content)
 
-                ## Example 1: Valid answer
-                {{
-                    "answer": "John Doe",
-                    "is_valid": true,
-                    "invalid_reason": "",
-                    "is_followup": false,
-                    "followup_prompt": ""
-                }}
-
-                ## Example 2: Invalid answer
-                {{
-                    "answer": "Blue",
-                    "is_valid": false,
-                    "invalid_reason": "Expected a full name, but the answer is a color.",
-                    "is_followup": false,
-                    "followup_prompt": ""
-                }}
-
-                ## Example 3: User needs help
-                {{
-                    "answer": "What should I put here?",
-                    "is_valid": true,
+    async def get_next_field_answer(self, field, answer, last_response):
+        # Well-formed dates, IDs, checkboxes etc. are settled without a round trip
+        local = validate_answer_locally(field, answer)
+        if local is not None:
+            ANSWER_VALIDATIONS.labels("local").inc()
+            return local
+        try:
+            result = await self.get_next_field_answer_prompt(field, answer, last_response)
+        except LLMUnavailable as e:
+            ANSWER_VALIDATIONS.labels("fallback").inc()
+            if "?" in answer or field_kind(field) is not None:
+                # A question, or a value of a kind the local rules know but could not
+                # settle: ask again rather than store it unchecked
+                log.warning("Asking again without validation", extra={"error": str(e)})
+                return {
+                    "answer": answer,
+                    "is_valid": False,
                     "invalid_reason": "",
-                    "is_followup": true,
-                    "followup_prompt": "This field requires your legal full name as it appears on official documents."
-                }}
-
-                Please return only a JSON object.
-            """
-
-            prompt = f"""
-                The user has provided an answer for the form field labeled '{field['label']}', which appears in the context of '{field['context']}'. Their response was:
-
-                "{answer}"
-
-                Your last response to the user was:
-
-                "{last_response}"
-                
-                If the user's previous question or answer was in a different language, continue in that langugage.
-            """
-
-
-            # Create chat completion request
-            completion = self.client.chat.completions.create(
-                model="Llama-4-Maverick-17B-128E-Instruct-FP8",
-                messages=[
-                    {
-                        "role": "developer",
-                        "content": context
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            { "type": "text", "text": prompt },
-                        ]
-                    }
-                ]
-            )
-
-            print(completion.choices[0].message.content)
-            return self._parse_llama_response(completion.choices[0].message.content)
+                    "is_followup": True,
+                    "followup_prompt": template_question(field),
+                }
+            # Accept free text unchecked rather than blocking the user
+            log.warning("Accepting answer without validation", extra={"error": str(e)})
+            return {
+                "answer": answer,
+                "is_valid": True,
+                "invalid_reason": "",
+                "is_followup": False,
+                "followup_prompt": "",
+            }
+        ANSWER_VALIDATIONS.labels("llm").inc()
+        return result
+
+    async def get_bulk_answers(self, fields, user_input, last_response):
+        """
+        Map a free-text message onto several of the given fields in one call.
+        Returns a list of {"inputfield", "answer", "is_valid", "invalid_reason"}
+        for the fields the message answers; local rules override the model's
+        verdict where they apply.
+        """
+        candidates = [
+            {
+                "inputfield": f["inputfield"],
+                "label": f.get("normalized_label") or f.get("label", ""),
+                "type": f.get("inputfield_type", "text"),
+                "context": f.get("context", ""),
+            }
+            for f in fields
+        ]
+        completion = await self.llm.chat(
+            messages=prompts.BULK_ANSWERS.messages(
+                fields=json.dumps(candidates), user_input=user_input, last_response=last_response
+            ),
+            prompt=prompts.BULK_ANSWERS.version,
+        )
+        ANSWER_VALIDATIONS.labels("llm").inc()
 
-    def get_next_field_answer(self, field, answer, last_response):
-        return self.get_next_field_answer_prompt(field, answer, last_response)
\ No newline at end of file
+        try:
+            items = self._parse_llama_response(completion.choices[0].message.content)
+        except ValueError as e:
+            log.warning("Could not parse bulk answers", extra={"error": str(e)})
+            return []
+
+        by_name = {f["inputfield"]: f for f in fields}
+        results = []
+        for item in items if isinstance(items, list) else []:
+            field = by_name.pop(item.get("inputfield"), None) if isinstance(item, dict) else None
+            # null or non-string answers mean the model found nothing usable for the field
+            answer = item.get("answer") if field else None
+            answer = answer.strip() if isinstance(answer, str) else ""
+            if not answer:
+                continue
+            result = {
+                "inputfield": field["inputfield"],
+                "answer": answer,
+                # Only a JSON true counts; "false" or a missing verdict is not an acceptance
+                "is_valid": item.get("is_valid") is True,
+                "invalid_reason": item.get("invalid_reason", "") or "",
+            }
+            local = validate_answer_locally(field, answer)
+            if local is not None:
+                result.update(answer=local["answer"], is_valid=local["is_valid"], invalid_reason=local["invalid_reason"])
+            results.append(result)
+        return results
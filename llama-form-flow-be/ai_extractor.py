@@ -1,27 +1,52 @@
+import asyncio
+import copy
+import logging
 from PIL import Image
-from io import BytesIO
-import base64
 import json
-from openai import OpenAI
 import os
-from dotenv import load_dotenv
-from pdf2image import convert_from_path
+
+
+import config
+import prompts
+from ai_client import LLMUnavailable
+from extraction_cache import image_cache_key
+from image_prep import RENDER_DPI, VisionImageSettings, prepare_image
+from json_stream import JsonArrayParser
+from layout_detection import detect_layout, snap_boxes
+from telemetry import span
+
+log = logging.getLogger(__name__)
+
+# Cap on detected shapes listed in the prompt when layout hints are enabled
+MAX_LAYOUT_HINTS = 80
+
+
+class IncompleteExtraction(Exception):
+    """
+    The vision reply never completed (continuations ran out or the stream
+    failed); `fields` holds what did arrive. Raised through the extraction
+    cache and template index so a partial page is never stored in either.
+    """
+
+    def __init__(self, fields):
+        super().__init__(f"Extraction incomplete after {len(fields)} fields")
+        self.fields = fields
+
+
+def _received_key(field):
+    """Identity of a field object as the model wrote it: name plus raw box"""
+    return field.get("inputfield"), json.dumps(field.get("bounding_box"))
 
 
 class FormExtraction:
-    def __init__(self):
-        load_dotenv()
-        self.client = OpenAI(
-            api_key=os.getenv("LLAMA_API_KEY"),
-            base_url="https://api.llama.com/compat/v1/"
-        )
-    
-    def _convert_to_base64(self, image):
-        """Convert PIL Image to base64 string"""
-        image_io = BytesIO()
-        image.save(image_io, format='PNG')
-        return base64.b64encode(image_io.getvalue()).decode()
-        
+    def __init__(self, llm, cache=None, image_settings=None, layout_snap=None, layout_hints=None, templates=None):
+        self.llm = llm
+        self.cache = cache
+        self.templates = templates
+        self.image_settings = image_settings or VisionImageSettings()
+        self.layout_snap = config.LAYOUT_SNAP if layout_snap is None else layout_snap
+        self.layout_hints = config.LAYOUT_HINTS if layout_hints is None else layout_hints
+
     def _parse_llama_response(self, response_text):
         """Parse the Llama API response and ensure it's valid JSON"""
         # Remove markdown code block formatting if present
@@ -38,114 +63,230 @@ class FormExtraction:
         except json.JSONDecodeError as e:
             raise ValueError(f"Failed to parse Llama API response: {str(e)}")
     
-    def extract_form_fields(self, file_path, session_path):
+    async def extract_form_fields(self, file_path, session_path):
         """
         Extract form fields from an image file (PDF, PNG, JPG, etc.)
         Returns a JSON object containing form field information
         """
         # Handle PDF files
         image = Image.open(file_path)
-        image_width, image_height = image.size
-        image_width_minus_1 = image_width - 1
-        image_height_minus_1 = image_height - 1
-        
-        # Convert image to base64
-        image_base64 = self._convert_to_base64(image)
-        
-        # Create chat completion request
-        completion = self.client.chat.completions.create(
-            model="Llama-4-Maverick-17B-128E-Instruct-FP8",
-            messages=[
-                {
-                    "role": "developer",
-                    "content": f"""
-You are a world-class AI system specialized in form understanding and document intelligence. Your task is to analyze a scanned form image and extract all user-fillable input fields.The image below has been rendered at a resolution of **300 DPI**, and its pixel dimensions are **{image_width}x{image_height}**. All bounding boxes you return must match this exact coordinate system. Return the bounding box in **[x, y, width, height]** in **pixels**, aligned with the original image dimensions, starting at the top-left corner.
-
-The image below is a single‐page scanned png image rendered at exactly 300 DPI with pixel dimensions **{image_width}×{image_height}**. 
-That means the top‐left pixel is (0,0)  and the bottom‐right pixel is ({image_width_minus_1},{image_height_minus_1}). 
-
-**INSTRUCTIONS FOR BOUNDING BOXES:**
-• All bounding boxes you return must be integer pixel coordinates in the range [0..{image_width_minus_1}] × [0..{image_height_minus_1}].  
-• Use the format `[x, y, width, height]`, where `(x,y)` is the top‐left pixel of the field and `width`/`height` are in pixels.  
-• DO NOT normalize or scale to [0–1]. DO NOT return any relative or percentage coordinates.  
-
-**INSTRUCTIONS FOR INPUT FIELDS:**
-For each input field, identify and return the following:
-- inputfield: A unique name or identifier for the input field
-- label: The text label or question associated with the input field
-- normalized_label: The normalized label of the field, which is the label without any extra text or formatting for example "First Name" instead of "(a)First Name:"
-- bounding_box: The bounding box of the field in (x, y, width, height) format
-- context: A short snippet of surrounding text or layout to provide context for the field
-- page: The page number (starting from 1)
-- document_name: The name of the document
-- inputfield_type: The type of input expected (e.g., text, checkbox, date, signature, radio)
-- inputfield_confidence: Your confidence in this being a valid, user-fillable input field (0.0 - 1.0)
-
-# Return the JSON array of input fields
-Return a JSON array of objects — one for each input field — following this structure exactly:
-[
-  {{
-    "inputfield": "first_name",
-    "label": "First Name:",
-    "normalized_label": "First Name",
-    "bounding_box": [120, 430, 200, 30],
-    "context": "Please fill out the following personal information.",
-    "page": 1,
-    "document_name": "IRS Form 1040",
-    "inputfield_type": "text",
-    "inputfield_confidence": 0.97
-  }},
-  ...
-]
-"""
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        { "type": "text", "text": "Please extract and return all form fields from the image below in the requested JSON format." },
-                        { "type": "image_url", "image_url": { "url": f"data:image/png;base64,{image_base64}" } }
-                    ]
-                }
-            ],
+        image.load()
+
+        response_json = await self.extract_page_fields(image, page=1)
+        self.save_session_fields(session_path, response_json)
+        return response_json
+
+    async def extract_page_fields(self, image, page=1, on_field=None):
+        """
+        Extract the fields of one rendered page.
+        The returned fields carry the given page number whatever the model says.
+
+        on_field, if given, is awaited with each field (page set) as soon as it
+        is known: while the vision reply streams in, or all at once when the
+        page came from a cache or template.
+        """
+        emitted = 0
+
+        async def emit(field):
+            nonlocal emitted
+            emitted += 1
+            if on_field:
+                await on_field(dict(field, page=page))
+
+        namespace = (
+            f"{self.llm.model}|{prompts.VISION_EXTRACTION.version}|{self.image_settings.signature()}"
+            f"|layout={int(self.layout_snap)}{int(self.layout_hints)}"
         )
+        try:
+            if self.cache is not None:
+                # Identical pages (e.g. the same blank form) skip the vision call
+                with span("cache_key"):
+                    key = await asyncio.to_thread(image_cache_key, image, namespace)
+                fields = await self.cache.get_or_extract(key, lambda: self._extract_or_match(image, namespace, emit))
+            else:
+                fields = await self._extract_or_match(image, namespace, emit)
+        except IncompleteExtraction as e:
+            # This build uses what arrived; the next upload of the page extracts it again
+            fields = copy.deepcopy(e.fields)
 
-            # response_format={
-            #     "type": "json_schema",
-            #     "json_schema": {
-            #         "schema": {
-            #             "type": "array",
-            #             "items": {
-            #                 "type": "object",
-            #                 "properties": {
-            #                     "inputfield": {"type": "string"},
-            #                     "label": {"type": "string"},
-            #                     "normalized_label": {"type": "string"},
-            #                     "bounding_box": {"type": "array"},
-            #                     "context": {"type": "string"},
-            #                     "page": {"type": "number"},
-            #                     "document_name": {"type": "string"},
-            #                     "inputfield_type": {"type": "string"},
-            #                     "inputfield_confidence": {"type": "number"}
-            #                 },
-            #                 "required": ["inputfield", "label", "normalized_label", "bounding_box", "context", "page", "document_name", "inputfield_type", "inputfield_confidence"]
-            #             }
-            #         },
-            #         "type": "array"
-            #         }
-            #     }        
-        
-        # Parse the response
-        response_text = completion.choices[0].message.content
-        response_json = self._parse_llama_response(response_text)
+        for field in fields:
+            field["page"] = page
+        if on_field:
+            for field in fields[emitted:]:
+                await on_field(field)
+        return fields
+
+    async def _extract_or_match(self, image, namespace, on_field=None):
+        """
+        Reuse the fields of a known template that looks like this page (a
+        rescan of a form seen before), aligned onto it; otherwise run the
+        vision extraction and register the page as a new template.
+        """
+        if self.templates is None:
+            return await self._extract_image_fields(image, on_field)
+        with span("template_match"):
+            fields = await asyncio.to_thread(self.templates.match, image, namespace)
+        if fields is not None:
+            return fields
+        fields = await self._extract_image_fields(image, on_field)
+        if fields:
+            with span("template_add"):
+                await asyncio.to_thread(self.templates.add, image, namespace, fields)
+        return fields
 
+    async def resolve_field_labels(self, fields, page_text):
+        """
+        Fill in label, normalized_label and context for fields read from PDF
+        widgets whose label could not be found locally. Text-only, so much
+        cheaper than a vision extraction.
+        """
+        unresolved = [
+            {"inputfield": f["inputfield"], "inputfield_type": f["inputfield_type"], "bounding_box": f["bounding_box"]}
+            for f in fields if not f.get("label_resolved", True)
+        ]
+        if unresolved:
+            try:
+                completion = await self.llm.chat(
+                    call_type="labels",
+                    messages=prompts.FIELD_LABELS.messages(page_text=page_text, fields=json.dumps(unresolved)),
+                    prompt=prompts.FIELD_LABELS.version,
+                )
+            except LLMUnavailable as e:
+                # Degrade to the labels found locally
+                log.warning("Could not resolve field labels", extra={"error": str(e)})
+                completion = None
+            try:
+                labels = {item["inputfield"]: item for item in self._parse_llama_response(completion.choices[0].message.content)} if completion else {}
+            except (ValueError, KeyError, TypeError) as e:
+                log.warning("Could not parse field labels", extra={"error": str(e)})
+                labels = {}
+            for field in fields:
+                item = labels.get(field["inputfield"])
+                if item:
+                    # A radio group's option labels were read off the page; keep them
+                    options = field.get("context", "").partition("Options:")[2]
+                    for key in ("label", "normalized_label", "context"):
+                        if item.get(key):
+                            field[key] = item[key]
+                    if options and "Options:" not in field["context"]:
+                        field["context"] = f"{field['context']} Options:{options}".strip()
+
+        for field in fields:
+            field.pop("label_resolved", None)
+        return fields
+
+    def save_session_fields(self, session_path, fields):
         # Create session directory if it doesn't exist
         os.makedirs(session_path, exist_ok=True)
 
         # save the response to a file
         response_file_path = os.path.join(session_path, "session.json")
         with open(response_file_path, "w") as f:
-            json.dump(response_json, f)
+            json.dump(fields, f)
 
-        return response_json
-        
-                
\ No newline at end of file
+    @staticmethod
+    def _timed(stage, fn, *args):
+        with span(stage):
+            return fn(*args)
+
+    def _layout_hint_text(self, layout, prepared):
+        """Describe detected checkbox squares and fill-in lines in the prepared image's coordinates"""
+        checkboxes = [prepared.to_prepared_box(box) for box in layout.checkboxes[:MAX_LAYOUT_HINTS]]
+        lines = [prepared.to_prepared_box(box) for box in layout.fill_lines(prepared.source_width)[:MAX_LAYOUT_HINTS]]
+        text = ""
+        if checkboxes:
+            text += f"\n\nDetected checkbox squares [x, y, width, height]: {json.dumps(checkboxes, separators=(',', ':'))}"
+        if lines:
+            text += f"\n\nDetected fill-in lines [x, y, width, height]: {json.dumps(lines, separators=(',', ':'))}"
+        if text:
+            text += "\n\nUse these shapes for the bounding boxes of matching fields."
+        return text
+
+    def _vision_messages(self, prepared, hints=""):
+        return prompts.VISION_EXTRACTION.messages(
+            images=[prepared.data_url()],
+            image_format=self.image_settings.format,
+            image_dpi=round(RENDER_DPI * prepared.scale),
+            width=prepared.width,
+            height=prepared.height,
+            max_x=prepared.width - 1,
+            max_y=prepared.height - 1,
+            hints=hints,
+        )
+
+    async def _extract_image_fields(self, image, on_field=None):
+        """
+        Ask the vision model for the fields of a single page image.
+        The page is shrunk/re-encoded per image_settings and the returned boxes
+        are mapped back onto the original render, then snapped onto the rule
+        lines and checkbox squares detected on it.
+
+        The completion is streamed and parsed incrementally: on_field, if given,
+        is awaited with each field as soon as its object closes. When the reply
+        is cut off or its tail is malformed, only the missing fields are
+        requested again (up to EXTRACTION_CONTINUATIONS times) instead of the
+        whole page. If the reply still is not complete, or the stream failed
+        along the way, IncompleteExtraction carries the fields received.
+        """
+        layout = None
+        if self.layout_snap or self.layout_hints:
+            # Decode once up front; PIL's lazy load is not safe from two threads
+            with span("image_decode"):
+                await asyncio.to_thread(image.load)
+            prepared, layout = await asyncio.gather(
+                asyncio.to_thread(self._timed, "image_prep", prepare_image, image, self.image_settings),
+                asyncio.to_thread(self._timed, "layout_detect", detect_layout, image),
+            )
+        else:
+            prepared = await asyncio.to_thread(self._timed, "image_prep", prepare_image, image, self.image_settings)
+        hints = self._layout_hint_text(layout, prepared) if self.layout_hints else ""
+        messages = self._vision_messages(prepared, hints)
+
+        fields = []
+        received = []  # as the model wrote them, for continuation requests
+        claimed = set()
+        stream_failed = False
+        for attempt in range(config.EXTRACTION_CONTINUATIONS + 1):
+            earlier = {_received_key(field) for field in received}
+            if attempt:
+                last = received[-1].get("inputfield", "") if received else ""
+                log.info("Extraction reply incomplete, requesting the rest", extra={"received": len(received)})
+                request = messages + [
+                    {"role": "assistant", "content": json.dumps(received)},
+                    {"role": "user", "content": prompts.EXTRACTION_CONTINUATION.render(last=last)},
+                ]
+            else:
+                request = messages
+
+            parser = JsonArrayParser()
+            try:
+                async for text in self.llm.chat_stream(
+                    messages=request, call_type="extraction", prompt=prompts.VISION_EXTRACTION.version
+                ):
+                    for field in parser.feed(text):
+                        if _received_key(field) in earlier:
+                            continue  # repeated by a continuation; name clashes are left to merge_page_fields
+                        received.append(copy.deepcopy(field))
+                        box = field.get("bounding_box")
+                        if isinstance(box, list) and len(box) >= 4:
+                            field["bounding_box"] = prepared.to_source_box(box)
+                        if self.layout_snap:
+                            snap_boxes([field], layout, claimed=claimed)
+                        fields.append(field)
+                        if on_field:
+                            await on_field(field)
+            except LLMUnavailable:
+                # A reply that died midway is continued like a truncated one, unless the provider is down
+                if not received or self.llm.breaker.state == "open":
+                    raise
+                stream_failed = True
+            if not parser.truncated and not parser.errors:
+                break
+            if not parser.started and not fields:
+                raise ValueError("Failed to parse Llama API response: no JSON array in reply")
+        else:
+            log.warning("Extraction reply still incomplete", extra={"kept": len(fields)})
+            raise IncompleteExtraction(fields)
+        if stream_failed:
+            raise IncompleteExtraction(fields)
+        return fields
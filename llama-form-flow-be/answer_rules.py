@@ -0,0 +1,199 @@
+import re
+from datetime import datetime
+
+from telemetry import metric_totals
+
+# Local checks for answers whose validity does not need the LLM. Each rule
+# either settles the answer (valid or clearly malformed) or returns None, in
+# which case the caller falls back to the LLM (free text, questions, other
+# languages, anything ambiguous).
+
+DATE_FORMATS = (
+    "%m/%d/%Y", "%m-%d-%Y", "%m.%d.%Y", "%Y-%m-%d", "%Y/%m/%d",
+    "%m/%d/%y", "%B %d, %Y", "%B %d %Y", "%b %d, %Y", "%b %d %Y",
+    "%d %B %Y", "%d %b %Y",
+)
+CHECKBOX_ANSWERS = {
+    "yes", "y", "no", "n", "true", "false", "checked", "unchecked",
+    "check", "x", "on", "off",
+}
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[a-zA-Z]{2,}$")
+CURRENCY_RE = re.compile(r"^-?\$?\s?-?(\d{1,3}(,\d{3})+|\d+)(\.\d{1,2})?$")
+# Answers made only of digits and separators; anything else goes to the LLM
+NUMERIC_RE = re.compile(r"^[\d\s\-().+/]+$")
+
+# Labels that are just one kind of value, compared after normalize_label.
+# Compound labels ("City or town, state, and ZIP code", "Mobile home park")
+# match none of them and go to the LLM.
+LABEL_KINDS = (
+    ("ssn", ("social security", "social security ssn", "ssn")),
+    ("ein", ("employer identification", "employer identification ein", "ein")),
+    ("zip", ("zip", "postal")),
+    (
+        "phone",
+        ("phone", "telephone", "mobile", "mobile phone", "cell", "cell phone", "home phone", "work phone",
+         "daytime phone", "fax"),
+    ),
+    ("email", ("email", "email address")),
+    ("currency", ("amount", "total amount", "wages", "income", "annual income", "salary")),
+    ("date", ("date", "date of birth", "birth date", "date signed", "today date", "todays date")),
+)
+# Words dropped before comparing, so "Your phone number:" reads as "phone"
+FILLER_WORDS = {"your", "the", "number", "code", "no"}
+# Kinds an inputfield_type may name directly
+TYPE_KINDS = {"checkbox", "radio", "date", "ssn", "ein", "zip", "phone", "email", "currency"}
+
+
+def normalize_label(label):
+    """Lowercase words of a label without enumerators ("(1)", "5a"), stray letters or filler words"""
+    label = str(label).lower().replace("e-mail", "email")
+    words = [w for w in re.findall(r"[a-z]+", re.sub(r"\b\d+[a-z]?\b", " ", label)) if len(w) > 1]
+    return " ".join(w for w in words if w not in FILLER_WORDS)
+
+
+def field_kind(field):
+    """
+    Classify a field from its inputfield_type, or from its normalized_label
+    when the label is essentially one of the LABEL_KINDS phrases. Anything
+    else is None, so its answers are validated by the LLM.
+    """
+    field_type = str(field.get("inputfield_type") or "").lower()
+    if field_type in TYPE_KINDS:
+        return field_type
+    label = normalize_label(field.get("normalized_label") or field.get("label") or "")
+    for kind, phrases in LABEL_KINDS:
+        if label in phrases:
+            return kind
+    return None
+
+
+def _result(answer, is_valid, invalid_reason=""):
+    return {
+        "answer": answer,
+        "is_valid": is_valid,
+        "invalid_reason": invalid_reason,
+        "is_followup": False,
+        "followup_prompt": "",
+    }
+
+
+def _digits(answer):
+    return re.sub(r"\D", "", answer)
+
+
+def _check_date(answer):
+    for fmt in DATE_FORMATS:
+        try:
+            datetime.strptime(answer, fmt)
+            return _result(answer, True)
+        except ValueError:
+            continue
+    return None
+
+
+def _check_choice(answer):
+    if answer.lower().rstrip(".!") in CHECKBOX_ANSWERS:
+        return _result(answer, True)
+    return None
+
+
+def radio_options(field):
+    """Option labels a radio group's context lists ("... Options: Single, Married"); none for a lone button"""
+    _, found, options = str(field.get("context") or "").partition("Options:")
+    return [option.strip() for option in options.split(",") if option.strip()] if found else []
+
+
+def _check_radio(field, answer):
+    # A yes or no cannot pick one of several options; only naming one of them settles it
+    options = radio_options(field)
+    if not options:
+        return _check_choice(answer)
+    wanted = re.findall(r"[a-z0-9]+", answer.lower())
+    for option in options:
+        if re.findall(r"[a-z0-9]+", option.lower()) == wanted:
+            return _result(option, True)
+    return None
+
+
+def _check_digits(answer, length, name):
+    if not NUMERIC_RE.match(answer):
+        return None
+    if len(_digits(answer)) == length:
+        return _result(answer, True)
+    return _result(answer, False, f"A {name} has {length} digits.")
+
+
+def _check_zip(answer):
+    if not NUMERIC_RE.match(answer):
+        return None
+    if re.fullmatch(r"\d{5}(-\d{4})?", answer):
+        return _result(answer, True)
+    return _result(answer, False, "A ZIP code has 5 digits, optionally followed by -1234.")
+
+
+def _check_phone(answer):
+    if not NUMERIC_RE.match(answer):
+        return None
+    digits = _digits(answer)
+    if len(digits) == 10 or (len(digits) == 11 and digits.startswith("1")):
+        return _result(answer, True)
+    # International numbers are left to the LLM
+    if answer.startswith("+"):
+        return None
+    return _result(answer, False, "A phone number should have 10 digits, including the area code.")
+
+
+def _check_email(answer):
+    if EMAIL_RE.match(answer):
+        return _result(answer, True)
+    if "@" in answer and " " not in answer:
+        return _result(answer, False, "That doesn't look like a complete email address.")
+    return None
+
+
+def _check_currency(answer):
+    if CURRENCY_RE.match(answer.replace(" ", "")):
+        return _result(answer, True)
+    return None
+
+
+RULES = {
+    "date": _check_date,
+    "checkbox": _check_choice,
+    "ssn": lambda answer: _check_digits(answer, 9, "Social Security number"),
+    "ein": lambda answer: _check_digits(answer, 9, "Employer Identification Number"),
+    "zip": _check_zip,
+    "phone": _check_phone,
+    "email": _check_email,
+    "currency": _check_currency,
+}
+
+
+def validate_answer_locally(field, answer):
+    """
+    Validate an answer without the LLM when the field kind allows it.
+    Returns the same structure as the LLM validation, or None if undecided.
+    """
+    answer = str(answer).strip()
+    if not answer or "?" in answer:
+        return None
+    kind = field_kind(field)
+    if kind == "radio":
+        return _check_radio(field, answer)
+    rule = RULES.get(kind)
+    if rule is None:
+        return None
+    return rule(answer)
+
+
+def validation_summary():
+    """How answers were validated, over every gunicorn worker"""
+    counts = metric_totals("formflow_answer_validations", "method")
+    local, llm = int(counts.get("local", 0)), int(counts.get("llm", 0))
+    total = local + llm
+    return {
+        "local": local,
+        "llm": llm,
+        "fallback": int(counts.get("fallback", 0)),
+        "local_share": local / total if total else 0.0,
+    }
@@ -0,0 +1,99 @@
+"""
+Measure scanned-page layout detection and box snapping.
+
+For every page reports the detection time, the shapes found and, for
+fillable PDFs, how far jittered widget boxes (standing in for the model's
+estimates) are from the true widgets before and after snapping. It then
+lists the vision payload at smaller image sizes: once snapping restores box
+precision the page can be sent smaller, and image tokens scale with pixels.
+
+    python benchmarks/bench_layout.py fw4.pdf
+    python benchmarks/bench_layout.py scan.pdf --jitter 30 --hints
+"""
+import argparse
+import copy
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from image_prep import VisionImageSettings, prepare_image
+from layout_detection import detect_layout, snap_boxes
+from native_extraction import extract_widget_fields
+from pipeline import count_pages, render_page
+
+MAX_EDGES = [0, 2000, 1600, 1280, 1024]
+
+
+def box_error(fields, truth):
+    """Mean absolute difference of the four box coordinates, in pixels"""
+    total = sum(
+        sum(abs(a - b) for a, b in zip(f["bounding_box"], t["bounding_box"]))
+        for f, t in zip(fields, truth)
+    )
+    return total / (4 * len(truth))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("document", help="PDF to benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="detection runs per page")
+    parser.add_argument("--jitter", type=int, default=20, help="max pixel error added to widget boxes")
+    parser.add_argument("--hints", action="store_true", help="also report the size of the prompt layout hints")
+    args = parser.parse_args()
+
+    document = Path(args.document)
+    random.seed(0)
+    first_image = None
+
+    print(f"{'page':>4} {'detect ms':>9} {'lines':>5} {'checks':>6} {'fields':>6} {'err before':>10} {'err after':>9} {'snapped':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for page in range(1, count_pages(document) + 1):
+            image = render_page(document, page, Path(tmp) / f"page_{page}.png")
+            first_image = first_image or image
+
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                layout = detect_layout(image)
+                timings.append(time.perf_counter() - start)
+            line = (
+                f"{page:>4} {min(timings) * 1000:>9.1f} "
+                f"{len(layout.horizontal) + len(layout.vertical):>5} {len(layout.checkboxes):>6}"
+            )
+
+            truth, _ = extract_widget_fields(document, page)
+            if truth:
+                estimated = copy.deepcopy(truth)
+                for field in estimated:
+                    field["bounding_box"] = [v + random.randint(-args.jitter, args.jitter) for v in field["bounding_box"]]
+                before = box_error(estimated, truth)
+                snapped = snap_boxes(estimated, layout)
+                line += f" {len(truth):>6} {before:>10.1f} {box_error(estimated, truth):>9.1f} {snapped:>7}"
+            print(line)
+
+    print()
+    print(f"{'max edge':>8} {'size':>11} {'payload':>10} {'pixels':>7}")
+    full_pixels = None
+    for max_edge in MAX_EDGES:
+        prepared = prepare_image(first_image, VisionImageSettings(max_edge=max_edge, format="png"))
+        pixels = prepared.width * prepared.height
+        full_pixels = full_pixels or pixels
+        print(
+            f"{max_edge or 'full':>8} {prepared.width:>5}x{prepared.height:<5} "
+            f"{len(prepared.data_url()) / 1024:>8.0f}KB {pixels / full_pixels:>6.0%}"
+        )
+
+    if args.hints:
+        from ai_extractor import FormExtraction
+
+        prepared = prepare_image(first_image, VisionImageSettings(max_edge=1600, format="png"))
+        hints = FormExtraction(llm=None, layout_hints=True)._layout_hint_text(detect_layout(first_image), prepared)
+        print(f"\nLayout hints for page 1 at max edge 1600: {len(hints)} chars (~{len(hints) // 4} tokens)")
+
+
+if __name__ == "__main__":
+    main()
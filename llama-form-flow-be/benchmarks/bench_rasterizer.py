@@ -0,0 +1,117 @@
+"""
+Compare the rasterizer backends on one document.
+
+Each backend renders every page of the document in a fresh process, so its
+peak resident memory is measured on its own (poppler's pdftoppm subprocesses
+are counted too). Reports pages/sec and peak RSS over the process's size
+before the first page.
+
+    python benchmarks/bench_rasterizer.py fw4.pdf
+    python benchmarks/bench_rasterizer.py fw4.pdf --dpi 200 --repeat 5 --backends pdfium,pymupdf
+
+With --pool, also renders --pool-pages pages through RasterPool (PNG and
+derivatives included, as during an upload) with 0 and --pool-workers
+workers, reporting throughput and the longest event-loop stall seen meanwhile.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import rasterizer
+from image_prep import RENDER_DPI
+
+
+def _peak_rss_mb():
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024
+
+
+def measure_backend(name, document, dpi, repeat, results):
+    """Runs in its own process; puts (pages, seconds, baseline MB, peak MB) or an error on `results`"""
+    try:
+        backend = rasterizer.backends([name])[0]
+        page_count = backend.page_count(document)
+        baseline = _peak_rss_mb()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for page in range(1, page_count + 1):
+                backend.render(document, page, dpi)
+        results.put((page_count * repeat, time.perf_counter() - start, baseline, _peak_rss_mb()))
+    except Exception as e:
+        results.put(str(e))
+
+
+async def _watch_loop(stop, interval=0.005):
+    """Longest time the loop took to come back from a short sleep"""
+    loop = asyncio.get_running_loop()
+    worst = 0.0
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        worst = max(worst, loop.time() - start - interval)
+    return worst
+
+
+async def measure_pool(workers, document, pages, dpi):
+    pool = rasterizer.RasterPool(workers)
+    await pool.start()
+    page_count = rasterizer.count_pages(document)
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(_watch_loop(stop))
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            pool.render_page(document, i % page_count + 1, Path(tmp) / f"page-{i}.png", dpi) for i in range(pages)
+        ))
+        elapsed = time.perf_counter() - start
+    stop.set()
+    stall = await watcher
+    pool.shutdown()
+    return elapsed, stall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("document", type=Path, help="PDF to rasterize")
+    parser.add_argument("--dpi", type=int, default=RENDER_DPI)
+    parser.add_argument("--repeat", type=int, default=3, help="times each backend renders the whole document")
+    parser.add_argument("--backends", default=",".join(rasterizer.BACKENDS), help="comma-separated backends to compare")
+    parser.add_argument("--pool", action="store_true", help="also time renders through RasterPool")
+    parser.add_argument("--pool-workers", type=int, default=2)
+    parser.add_argument("--pool-pages", type=int, default=12)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    print(f"{'backend':<10} {'pages':>6} {'pages/s':>8} {'ms/page':>8} {'base MB':>8} {'peak MB':>8}")
+    for name in args.backends.split(","):
+        results = context.Queue()
+        process = context.Process(target=measure_backend, args=(name, args.document, args.dpi, args.repeat, results))
+        process.start()
+        result = results.get()
+        process.join()
+        if isinstance(result, str):
+            print(f"{name:<10} unavailable: {result}")
+            continue
+        pages, seconds, baseline, peak = result
+        print(
+            f"{name:<10} {pages:>6} {pages / seconds:>8.2f} {seconds / pages * 1000:>8.1f} "
+            f"{baseline:>8.0f} {peak:>8.0f}"
+        )
+
+    if args.pool:
+        print(f"\n{'pool workers':<13} {'pages':>6} {'pages/s':>8} {'max loop stall ms':>18}")
+        for workers in (0, args.pool_workers):
+            elapsed, stall = asyncio.run(measure_pool(workers, args.document, args.pool_pages, args.dpi))
+            print(f"{workers:<13} {args.pool_pages:>6} {args.pool_pages / elapsed:>8.2f} {stall * 1000:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
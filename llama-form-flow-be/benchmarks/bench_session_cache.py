@@ -0,0 +1,102 @@
+"""
+Compare per-request session reads with and without the in-process session cache.
+
+Builds a throwaway database (a temporary SQLite file unless --database is given) with --sessions sessions of --fields fields,
+replays --requests lookups spread over the sessions (skewed towards recently
+active ones, like real chat traffic) and reports latency percentiles for
+db.session.get_session versus db.cache.SessionCache.get, plus the cache hit rate.
+
+    python benchmarks/bench_session_cache.py --fields 150
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def make_fields(count):
+    return [
+        {
+            "inputfield": f"field_{i}",
+            "label": f"Field {i} label:",
+            "normalized_label": f"Field {i}",
+            "bounding_box": [120, 40 * i, 600, 32],
+            "context": "Step 1: Enter personal information. " * 3,
+            "page": 1,
+            "document_name": "Benchmark form",
+            "inputfield_type": "text",
+            "inputfield_confidence": 0.95,
+        }
+        for i in range(count)
+    ]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report(name, samples):
+    print(
+        f"{name:<14} p50 {percentile(samples, 50) * 1000:7.3f}ms  p95 {percentile(samples, 95) * 1000:7.3f}ms  "
+        f"mean {statistics.mean(samples) * 1000:7.3f}ms"
+    )
+
+
+async def run(args):
+    from db.cache import SessionCache
+    from db.session import create_or_update_session, get_session, init_db
+
+    await init_db()
+    fields = make_fields(args.fields)
+    session_ids = [f"bench-{i}" for i in range(args.sessions)]
+    for session_id in session_ids:
+        await create_or_update_session(session_id, fields, 2550, 3300)
+
+    rng = random.Random(42)
+    lookups = [session_ids[min(int(rng.expovariate(1 / args.active)), args.sessions - 1)] for _ in range(args.requests)]
+
+    db_samples = []
+    for session_id in lookups:
+        start = time.perf_counter()
+        await get_session(session_id)
+        db_samples.append(time.perf_counter() - start)
+
+    cache = SessionCache(max_entries=args.cache_entries)
+    cache_samples = []
+    for session_id in lookups:
+        start = time.perf_counter()
+        await cache.get(session_id)
+        cache_samples.append(time.perf_counter() - start)
+
+    print(f"{args.requests} lookups over {args.sessions} sessions with {args.fields} fields each")
+    report("get_session", db_samples)
+    report("SessionCache", cache_samples)
+    print(f"cache hit rate {cache.stats()['hit_rate']:.1%} ({args.cache_entries} entries)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fields", type=int, default=100)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--active", type=int, default=50, help="mean index of the session a request hits")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--cache-entries", type=int, default=256)
+    parser.add_argument("--database", help="DATABASE_URL to use (default: a temporary SQLite file; 'memory' for in-process)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # db.session builds its engine from DATABASE_URL at import time
+        os.environ["DATABASE_URL"] = args.database or f"sqlite+aiosqlite:///{tmp}/bench.db"
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
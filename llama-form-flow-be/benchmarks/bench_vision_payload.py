@@ -0,0 +1,80 @@
+"""
+Compare vision payload settings for one page.
+
+Reports the encoded payload size and preprocessing time for each setting and,
+with --live, the end-to-end extraction latency against the configured Llama
+API (costs one vision call per setting).
+
+    python benchmarks/bench_vision_payload.py fw4.pdf
+    python benchmarks/bench_vision_payload.py fw4.pdf --live
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from image_prep import VisionImageSettings, prepare_image
+from pipeline import render_page
+
+SETTINGS = {
+    "png-full": dict(max_edge=0, format="png"),
+    "png-2000": dict(max_edge=2000, format="png"),
+    "jpeg-2000": dict(max_edge=2000, format="jpeg", quality=85),
+    "jpeg-1600-gray-crop": dict(max_edge=1600, grayscale=True, crop_margins=True, format="jpeg", quality=80),
+    "webp-1600-gray-crop": dict(max_edge=1600, grayscale=True, crop_margins=True, format="webp", quality=80),
+    "png-1600-binarized-crop": dict(max_edge=1600, binarize=True, crop_margins=True, format="png"),
+    "webp-1280-gray-crop": dict(max_edge=1280, grayscale=True, crop_margins=True, format="webp", quality=75),
+}
+
+
+async def extract_live(image, settings):
+    from ai_client import LlamaClient
+    from ai_extractor import FormExtraction
+
+    llm = LlamaClient()
+    try:
+        start = time.perf_counter()
+        fields = await FormExtraction(llm, image_settings=settings).extract_page_fields(image)
+        return time.perf_counter() - start, len(fields)
+    finally:
+        await llm.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("document", help="PDF or image to benchmark")
+    parser.add_argument("--page", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3, help="preprocessing runs per setting")
+    parser.add_argument("--live", action="store_true", help="also time a real extraction call per setting")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image = render_page(Path(args.document), args.page, Path(tmp) / "page.png")
+    print(f"Source page: {image.size[0]}x{image.size[1]}")
+
+    header = f"{'setting':<26} {'size':>11} {'payload':>10} {'prep ms':>8}"
+    if args.live:
+        header += f" {'e2e s':>7} {'fields':>6}"
+    print(header)
+
+    for name, kwargs in SETTINGS.items():
+        settings = VisionImageSettings(**kwargs)
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            prepared = prepare_image(image, settings)
+            timings.append(time.perf_counter() - start)
+        payload = len(prepared.data_url())
+        line = f"{name:<26} {prepared.width:>5}x{prepared.height:<5} {payload / 1024:>8.0f}KB {min(timings) * 1000:>8.1f}"
+        if args.live:
+            latency, field_count = asyncio.run(extract_live(image, settings))
+            line += f" {latency:>7.2f} {field_count:>6}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+Load-test the backend under gunicorn against the local mock LLM server.
+
+Starts benchmarks/mock_llm.py and then, for every --workers count, the app
+under gunicorn with uvicorn workers in a throwaway directory (own SQLite
+database, uploads and caches). At every --concurrency level that many
+virtual users run complete sessions: /form/start, then /form/next and
+/form/respond for each field, answering with values that pass local
+validation. Reports requests/sec, p50/p95/p99 per endpoint and the
+server's event-loop lag (from /metrics, all workers combined).
+
+    python benchmarks/load_test.py --workers 1,2,4 --concurrency 1,8,32
+    python benchmarks/load_test.py --cold --json results.json
+    python benchmarks/load_test.py --baseline results.json --tolerance 0.25   # exits 1 on regression
+
+--cold uploads a different image for every session and disables template
+matching, so every /form/start pays for a vision call.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+import httpx
+from PIL import Image, ImageDraw
+from prometheus_client.parser import text_string_to_metric_families
+
+from answer_rules import field_kind
+
+ANSWERS = {
+    "date": "01/02/1990",
+    "checkbox": "yes",
+    "radio": "yes",
+    "ssn": "123-45-6789",
+    "ein": "12-3456789",
+    "zip": "12345",
+    "phone": "(555) 123-4567",
+    "email": "jane@example.com",
+    "currency": "1,250.00",
+}
+ENDPOINTS = ("/form/start", "/form/next", "/form/respond")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def form_image(seed=None):
+    """A blank letter-size form at 150 DPI; a seed scatters marks so every image hashes differently"""
+    image = Image.new("RGB", (1275, 1650), "white")
+    draw = ImageDraw.Draw(image)
+    for i in range(14):
+        y = 150 + i * 95
+        draw.text((120, y - 30), f"{i + 1}. Field label", fill="black")
+        draw.line((120, y, 1100, y), fill="black", width=2)
+    if seed is not None:
+        rng = random.Random(seed)
+        for _ in range(40):
+            x, y = rng.randrange(1200), rng.randrange(1600)
+            draw.rectangle((x, y, x + 4, y + 4), fill="gray")
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def histogram_buckets(metrics_text, name):
+    """Cumulative (upper bound, count) pairs of a histogram, summed over label sets"""
+    buckets = {}
+    for family in text_string_to_metric_families(metrics_text):
+        if family.name != name:
+            continue
+        for sample in family.samples:
+            if sample.name.endswith("_bucket"):
+                bound = float(sample.labels["le"])
+                buckets[bound] = buckets.get(bound, 0) + sample.value
+    return sorted(buckets.items())
+
+
+def histogram_quantile(before, after, q):
+    """Quantile of the observations made between two scrapes, interpolated within buckets"""
+    start = dict(before)
+    deltas = [(bound, count - start.get(bound, 0)) for bound, count in after]
+    if not deltas or deltas[-1][1] <= 0:
+        return None
+    rank = q * deltas[-1][1]
+    lower_bound, lower_count = 0.0, 0
+    for bound, count in deltas:
+        if count >= rank:
+            if bound == float("inf"):
+                return lower_bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / max(count - lower_count, 1e-9)
+        lower_bound, lower_count = bound, count
+    return lower_bound
+
+
+class Results:
+    def __init__(self):
+        self.latencies = {endpoint: [] for endpoint in ENDPOINTS}
+        self.errors = 0
+        self.sessions = 0
+
+    def record(self, endpoint, seconds):
+        self.latencies[endpoint].append(seconds)
+
+
+async def timed(results, endpoint, request):
+    start = time.perf_counter()
+    try:
+        response = await request
+    except httpx.HTTPError:
+        results.errors += 1
+        return None
+    results.record(endpoint, time.perf_counter() - start)
+    if response.status_code >= 500:
+        results.errors += 1
+        return None
+    return response
+
+
+async def run_session(client, results, upload, max_turns):
+    response = await timed(results, "/form/start", client.post("/form/start", files={"file": ("form.png", upload, "image/png")}))
+    if response is None or "session_id" not in response.json():
+        return
+    session_id = response.json()["session_id"]
+    last_response = ""
+    for _ in range(max_turns):
+        response = await timed(results, "/form/next", client.get(
+            "/form/next", params={"session_id": session_id, "last_response": last_response, "compact": "true"},
+        ))
+        if response is None:
+            return
+        body = response.json()
+        if body.get("done") or "field" not in body:
+            break
+        field, last_response = body["field"], body.get("prompt", "")
+        answer = ANSWERS.get(field_kind(field), "Jane Doe")
+        response = await timed(results, "/form/respond", client.post("/form/respond", json={
+            "session_id": session_id, "user_input": answer, "last_response": last_response, "compact": True,
+        }))
+        if response is None or response.json().get("done"):
+            break
+    results.sessions += 1
+
+
+async def run_level(base_url, concurrency, sessions, max_turns, cold):
+    shared_upload = form_image()
+    counter = iter(range(sessions))
+    results = Results()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        metrics_before = (await client.get("/metrics")).text
+
+        async def user():
+            for _ in counter:
+                upload = await asyncio.to_thread(form_image, random.random()) if cold else shared_upload
+                await run_session(client, results, upload, max_turns)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        duration = time.perf_counter() - start
+        metrics_after = (await client.get("/metrics")).text
+
+    lag_before = histogram_buckets(metrics_before, "formflow_event_loop_lag_seconds")
+    lag_after = histogram_buckets(metrics_after, "formflow_event_loop_lag_seconds")
+    requests = sum(len(samples) for samples in results.latencies.values())
+    return {
+        "concurrency": concurrency,
+        "sessions": results.sessions,
+        "requests": requests,
+        "errors": results.errors,
+        "duration": duration,
+        "rps": requests / duration if duration else 0.0,
+        "endpoints": {
+            endpoint: {
+                "count": len(samples),
+                "p50": percentile(samples, 50),
+                "p95": percentile(samples, 95),
+                "p99": percentile(samples, 99),
+            }
+            for endpoint, samples in results.latencies.items()
+        },
+        "event_loop_lag": {
+            f"p{q}": histogram_quantile(lag_before, lag_after, q / 100) for q in (50, 95, 99)
+        },
+    }
+
+
+def wait_for(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args[:4]} exited with {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def start_mock(args):
+    port = free_port()
+    command = [
+        sys.executable, str(BACKEND_DIR / "benchmarks" / "mock_llm.py"), "--port", str(port),
+        "--extraction-latency", args.extraction_latency,
+        "--conversation-latency", args.conversation_latency,
+        "--fields", str(args.fields),
+    ]
+    process = subprocess.Popen(command)
+    wait_for(f"http://127.0.0.1:{port}/stats", process)
+    return process, f"http://127.0.0.1:{port}/compat/v1/"
+
+
+def start_backend(workers, llm_url, workdir, cold):
+    port = free_port()
+    env = dict(
+        os.environ,
+        LLAMA_BASE_URL=llm_url,
+        LLAMA_API_KEY="mock",
+        DATABASE_URL=f"sqlite+aiosqlite:///{workdir}/bench.db",
+        PROMETHEUS_MULTIPROC_DIR=str(workdir / "metrics"),
+        LOG_LEVEL=os.environ.get("LOG_LEVEL", "WARNING"),
+    )
+    if cold:
+        env["TEMPLATE_MATCHING"] = "false"
+    command = [
+        sys.executable, "-m", "gunicorn", "main:app",
+        "-c", str(BACKEND_DIR / "gunicorn_conf.py"),
+        "-k", "uvicorn.workers.UvicornWorker",
+        "-w", str(workers),
+        "-b", f"127.0.0.1:{port}",
+        "--pythonpath", str(BACKEND_DIR),
+        "--log-level", "warning",
+    ]
+    process = subprocess.Popen(command, cwd=workdir, env=env)
+    wait_for(f"http://127.0.0.1:{port}/stats/validation", process)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def stop(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def _ms(value):
+    return f"{value * 1000:8.1f}" if value is not None else "       -"
+
+
+def print_level(workers, level):
+    lag = level["event_loop_lag"]
+    print(
+        f"\nworkers={workers} concurrency={level['concurrency']}: {level['sessions']} sessions, "
+        f"{level['requests']} requests in {level['duration']:.1f}s = {level['rps']:.1f} req/s, {level['errors']} errors"
+    )
+    print(f"  {'endpoint':<16}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for endpoint, stats in level["endpoints"].items():
+        print(f"  {endpoint:<16}{stats['count']:>7}{_ms(stats['p50'])} {_ms(stats['p95'])} {_ms(stats['p99'])}")
+    print(f"  {'event loop lag':<16}{'':>7}{_ms(lag['p50'])} {_ms(lag['p95'])} {_ms(lag['p99'])}")
+
+
+def regressions(runs, baseline, tolerance):
+    """Messages for every level whose throughput fell or whose p95 rose by more than tolerance"""
+    base = {(run["workers"], level["concurrency"]): level for run in baseline["runs"] for level in run["levels"]}
+    problems = []
+    for run in runs:
+        for level in run["levels"]:
+            key = (run["workers"], level["concurrency"])
+            old = base.get(key)
+            if not old:
+                continue
+            if level["rps"] < old["rps"] * (1 - tolerance):
+                problems.append(f"workers={key[0]} concurrency={key[1]}: {level['rps']:.1f} req/s, baseline {old['rps']:.1f}")
+            for endpoint, stats in level["endpoints"].items():
+                old_p95 = old["endpoints"].get(endpoint, {}).get("p95")
+                if stats["p95"] is not None and old_p95 and stats["p95"] > old_p95 * (1 + tolerance):
+                    problems.append(
+                        f"workers={key[0]} concurrency={key[1]} {endpoint}: p95 {stats['p95'] * 1000:.1f}ms, "
+                        f"baseline {old_p95 * 1000:.1f}ms"
+                    )
+            if level["errors"] > old["errors"]:
+                problems.append(f"workers={key[0]} concurrency={key[1]}: {level['errors']} errors, baseline {old['errors']}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2", help="comma-separated gunicorn worker counts")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated numbers of virtual users")
+    parser.add_argument("--sessions", type=int, default=40, help="sessions per concurrency level")
+    parser.add_argument("--turns", type=int, default=10, help="next/respond rounds per session at most")
+    parser.add_argument("--fields", type=int, default=30, help="fields in each mock extraction")
+    parser.add_argument("--extraction-latency", default="lognormal:2:0.4")
+    parser.add_argument("--conversation-latency", default="lognormal:0.4:0.4")
+    parser.add_argument("--cold", action="store_true", help="unique upload per session, no template matching")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    args = parser.parse_args()
+
+    mock, llm_url = start_mock(args)
+    runs = []
+    try:
+        for workers in [int(w) for w in args.workers.split(",")]:
+            with tempfile.TemporaryDirectory() as tmp:
+                backend, base_url = start_backend(workers, llm_url, Path(tmp), args.cold)
+                try:
+                    levels = []
+                    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+                        level = asyncio.run(run_level(base_url, concurrency, args.sessions, args.turns, args.cold))
+                        print_level(workers, level)
+                        levels.append(level)
+                    runs.append({"workers": workers, "levels": levels})
+                finally:
+                    stop(backend)
+    finally:
+        stop(mock)
+
+    results = {"args": vars(args), "runs": runs}
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+    if args.baseline:
+        problems = regressions(runs, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
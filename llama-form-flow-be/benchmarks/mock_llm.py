@@ -0,0 +1,213 @@
+"""
+Local stand-in for the OpenAI-compatible /compat/v1/chat/completions endpoint.
+
+Recognises the backend's prompts (see prompts.py) and answers each with a
+canned reply: a field list for vision extraction, a question for the next
+field, an accepting verdict for answer validation. Latency is drawn per call
+kind from a configurable distribution; streamed replies are split into
+chunks with a delay between them and end with a usage chunk.
+
+    python benchmarks/mock_llm.py --port 8100
+    python benchmarks/mock_llm.py --extraction-latency lognormal:6:0.5 --conversation-latency fixed:0.4
+
+Latency specs: "fixed:S", "uniform:LO:HI" or "lognormal:MEDIAN:SIGMA" (seconds).
+Point the backend at it with LLAMA_BASE_URL=http://127.0.0.1:8100/compat/v1/.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+import prompts
+
+LABELS = [
+    ("First Name", "text"),
+    ("Last Name", "text"),
+    ("Date of Birth", "date"),
+    ("Social Security Number", "text"),
+    ("Street Address", "text"),
+    ("City", "text"),
+    ("State", "text"),
+    ("ZIP Code", "text"),
+    ("Phone", "text"),
+    ("Email", "text"),
+    ("Employer", "text"),
+    ("Married", "checkbox"),
+    ("Signature", "signature"),
+    ("Date", "date"),
+]
+
+
+def latency_sampler(spec):
+    """Callable returning a delay in seconds for a "kind:params" spec"""
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(":") if v]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda: random.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"Unknown latency distribution {spec!r}")
+
+
+def _text(message):
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return "\n".join(part.get("text", "") for part in content if part.get("type") == "text")
+    return content
+
+
+def _match(pattern, text, default=""):
+    found = re.search(pattern, text, re.S)
+    return found.group(1) if found else default
+
+
+def extraction_reply(user_text, field_count):
+    width = int(_match(r"\*\*(\d+)×\d+\*\*", user_text, "2550"))
+    height = int(_match(r"\*\*\d+×(\d+)\*\*", user_text, "3300"))
+    row = max(1, height // (field_count + 2))
+    fields = []
+    for i in range(field_count):
+        label, field_type = LABELS[i % len(LABELS)]
+        box = [width // 10, row * (i + 1), width // 2, max(1, row // 2)]
+        if field_type == "checkbox":
+            box[2] = box[3]
+        fields.append({
+            "inputfield": f"field_{i}",
+            "label": f"({i + 1}) {label}:",
+            "normalized_label": label,
+            "bounding_box": box,
+            "context": f"Section {i // 5 + 1}: personal information",
+            "page": 1,
+            "document_name": "Mock form",
+            "inputfield_type": field_type,
+            "inputfield_confidence": 0.95,
+        })
+    return "```json\n" + json.dumps(fields, indent=2) + "\n```"
+
+
+def classify(messages):
+    """(call kind, canned reply) for a chat request from the backend"""
+    system = _text(messages[0]) if messages and messages[0].get("role") in ("developer", "system") else ""
+    user = _text(messages[-1]) if messages else ""
+    if any(m.get("role") == "assistant" for m in messages):
+        return "extraction", "[]"  # continuation of a cut-off extraction
+    if system == prompts.VISION_EXTRACTION.system:
+        return "extraction", None
+    if system == prompts.NEXT_QUESTION.system:
+        label = _match(r'Field Label: "(.*?)"\n', user, "this field")
+        return "conversation", f"Could you tell me your {label.rstrip(':').lower()}?"
+    if system == prompts.ANSWER_VALIDATION.system:
+        answer = _match(r'Their response was:\s*"(.*?)"\s*Your last response', user)
+        return "conversation", json.dumps({
+            "answer": answer, "is_valid": True, "invalid_reason": "", "is_followup": False, "followup_prompt": "",
+        })
+    if system == prompts.BULK_ANSWERS.system or system == prompts.FIELD_LABELS.system:
+        return "conversation", "[]"
+    return "conversation", "OK"
+
+
+def usage(messages, reply):
+    prompt_chars = sum(len(_text(m)) for m in messages)
+    images = sum(
+        1 for m in messages if isinstance(m.get("content"), list)
+        for part in m["content"] if part.get("type") == "image_url"
+    )
+    prompt_tokens = prompt_chars // 4 + images * 1500
+    completion_tokens = len(reply) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+
+def create_app(args):
+    app = FastAPI()
+    samplers = {
+        "extraction": latency_sampler(args.extraction_latency),
+        "conversation": latency_sampler(args.conversation_latency),
+    }
+    stats = {"requests": 0, "errors": 0}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/compat/v1/chat/completions")
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        kind, reply = classify(messages)
+        if reply is None:
+            reply = extraction_reply(_text(messages[-1]), args.fields)
+        stats["requests"] += 1
+        await asyncio.sleep(samplers[kind]())
+        if random.random() < args.error_rate:
+            stats["errors"] += 1
+            return JSONResponse(status_code=500, content={"error": {"message": "mock failure", "type": "server_error"}})
+
+        model = body.get("model", "mock")
+        created = int(time.time())
+        if not body.get("stream"):
+            return {
+                "id": "mock", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": usage(messages, reply),
+            }
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+        async def chunks():
+            for i in range(0, len(reply), args.chunk_chars):
+                delta = {"content": reply[i:i + args.chunk_chars]}
+                chunk = {
+                    "id": "mock", "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                if args.chunk_delay:
+                    await asyncio.sleep(args.chunk_delay)
+            if include_usage:
+                chunk = {
+                    "id": "mock", "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [], "usage": usage(messages, reply),
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    return app
+
+
+def parser():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8100)
+    p.add_argument("--extraction-latency", default="lognormal:4:0.4", help="time to first token of vision calls")
+    p.add_argument("--conversation-latency", default="lognormal:0.6:0.4", help="time to first token of text calls")
+    p.add_argument("--chunk-chars", type=int, default=24, help="characters per streamed chunk")
+    p.add_argument("--chunk-delay", type=float, default=0.005, help="seconds between streamed chunks")
+    p.add_argument("--fields", type=int, default=30, help="fields in each extraction reply")
+    p.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with HTTP 500")
+    return p
+
+
+def main():
+    args = parser().parse_args()
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import os
+from dotenv import load_dotenv
+
+# Loaded once at import time instead of in every FormConversation/FormExtraction.
+load_dotenv()
+
+LLAMA_API_KEY = os.getenv("LLAMA_API_KEY")
+LLAMA_BASE_URL = os.getenv("LLAMA_BASE_URL", "https://api.llama.com/compat/v1/")
+LLAMA_MODEL = os.getenv("LLAMA_MODEL", "Llama-4-Maverick-17B-128E-Instruct-FP8")
+
+# HTTP connection pool shared by every LLM call in a worker process
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "16"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+# Upper bound on in-flight completions per worker
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+
+# Background extraction jobs for /form/start?mode=async
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "64"))
+# Workers renew the lease of every job they hold (queued or running) each
+# JOB_HEARTBEAT_INTERVAL; jobs whose lease lapses for JOB_STALE_SECONDS are
+# assumed orphaned and re-queued
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "600"))
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "30"))
+JOB_RECOVERY_INTERVAL = float(os.getenv("JOB_RECOVERY_INTERVAL", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# Content-addressed cache of extracted field lists
+EXTRACTION_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", "cache/extractions")
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "512"))
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Page rendering and per-page extraction fan-out
+MAX_PAGES = int(os.getenv("MAX_PAGES", "50"))
+EXTRACTION_PAGE_CONCURRENCY = int(os.getenv("EXTRACTION_PAGE_CONCURRENCY", "4"))
+# Rasterizer backends, tried in order until one renders the PDF (pdfium, pymupdf, poppler)
+RASTERIZER_BACKENDS = [b.strip() for b in os.getenv("RASTERIZER_BACKENDS", "pdfium,pymupdf,poppler").split(",") if b.strip()]
+# Processes pages are rendered on, per server worker; 0 renders on a thread of the server process
+RASTER_WORKERS = int(os.getenv("RASTER_WORKERS", "2"))
+
+# Preprocessing of the page image sent to the vision model
+VISION_MAX_EDGE = int(os.getenv("VISION_MAX_EDGE", "0"))  # 0 keeps the full 300 DPI render
+VISION_GRAYSCALE = os.getenv("VISION_GRAYSCALE", "false").lower() == "true"
+VISION_BINARIZE = os.getenv("VISION_BINARIZE", "false").lower() == "true"
+VISION_CROP_MARGINS = os.getenv("VISION_CROP_MARGINS", "false").lower() == "true"
+VISION_FORMAT = os.getenv("VISION_FORMAT", "png")  # png, jpeg or webp
+VISION_QUALITY = int(os.getenv("VISION_QUALITY", "85"))
+
+# In-process cache of immutable session data (field lists, image size)
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "1024"))
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "600"))
+# How often a worker checks the invalidation log for sessions rebuilt elsewhere
+SESSION_CACHE_POLL_INTERVAL = float(os.getenv("SESSION_CACHE_POLL_INTERVAL", "1"))
+
+# Storage backend: any SQLAlchemy async URL, or "memory" for a throwaway in-process SQLite
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./form_sessions.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+SQLITE_WAL = os.getenv("SQLITE_WAL", "true").lower() == "true"
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Preview derivatives generated per page for /form/render
+RENDER_WIDTHS = [int(w) for w in os.getenv("RENDER_WIDTHS", "480,960,1600").split(",") if w.strip()]
+RENDER_FORMATS = [f.strip() for f in os.getenv("RENDER_FORMATS", "webp,jpeg").split(",") if f.strip()]
+RENDER_QUALITY = int(os.getenv("RENDER_QUALITY", "80"))
+
+# Uploads are streamed to disk in chunks of UPLOAD_CHUNK_SIZE bytes and rejected past UPLOAD_MAX_BYTES
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(256 * 1024)))
+
+# Maximum sessions in one /form/export/bulk archive
+EXPORT_BULK_MAX = int(os.getenv("EXPORT_BULK_MAX", "500"))
+
+# Read fields straight from AcroForm widgets of fillable PDFs instead of the vision model
+NATIVE_EXTRACTION = os.getenv("NATIVE_EXTRACTION", "true").lower() == "true"
+
+# Scanned-page layout detection: snap model boxes onto detected rule lines and
+# checkbox squares, and optionally list the detected geometry in the prompt.
+# Off by default: benchmarks/bench_layout.py shows no reliable box improvement
+# for the OpenCV work it adds per page.
+LAYOUT_SNAP = os.getenv("LAYOUT_SNAP", "false").lower() == "true"
+LAYOUT_HINTS = os.getenv("LAYOUT_HINTS", "false").lower() == "true"
+
+# Reuse the fields of a previously extracted page that looks the same (e.g. the
+# same blank form scanned by another user) instead of calling the vision model
+TEMPLATE_MATCHING = os.getenv("TEMPLATE_MATCHING", "true").lower() == "true"
+TEMPLATE_INDEX_DIR = os.getenv("TEMPLATE_INDEX_DIR", "cache/templates")
+TEMPLATE_MAX_ENTRIES = int(os.getenv("TEMPLATE_MAX_ENTRIES", "1000"))
+TEMPLATE_MAX_DISTANCE = int(os.getenv("TEMPLATE_MAX_DISTANCE", "64"))  # of 256 hash bits
+TEMPLATE_MIN_INLIERS = int(os.getenv("TEMPLATE_MIN_INLIERS", "40"))
+
+# Follow-up requests for the missing tail of a cut-off or malformed extraction reply
+EXTRACTION_CONTINUATIONS = int(os.getenv("EXTRACTION_CONTINUATIONS", "2"))
+
+# Resilience of LLM calls: per-attempt deadlines (seconds), jittered retries,
+# hedged conversational calls and a circuit breaker
+LLM_EXTRACTION_TIMEOUT = float(os.getenv("LLM_EXTRACTION_TIMEOUT", "120"))
+LLM_CONVERSATION_TIMEOUT = float(os.getenv("LLM_CONVERSATION_TIMEOUT", "20"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+# Used until enough latencies are recorded to hedge at the observed p95
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "2"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.3"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+# Ask for token usage on streamed replies (stream_options.include_usage); disable
+# for OpenAI-compatible servers that reject the option
+LLM_STREAM_USAGE = os.getenv("LLM_STREAM_USAGE", "true").lower() == "true"
+
+# Remaining fields offered to the model when one message answers several (/form/respond/bulk)
+BULK_MAX_FIELDS = int(os.getenv("BULK_MAX_FIELDS", "60"))
+
+# Prefill answers from earlier forms of the same user; users opt in with a token
+# from POST /profile sent as X-Profile-Token to /form/start
+PROFILE_MEMORY = os.getenv("PROFILE_MEMORY", "false").lower() == "true"
+
+# Structured logging: "json" (one object per line) or "text"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Seconds between event-loop lag probes (formflow_event_loop_lag_seconds); 0 disables
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv("EVENT_LOOP_LAG_INTERVAL", "0.25"))
@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+
+import config
+from telemetry import SESSION_CACHE_ENTRIES, SESSION_CACHE_LOOKUPS, metric_totals
+from db.session import (
+    create_or_update_session,
+    get_current_index,
+    get_invalidations_since,
+    get_last_invalidation_id,
+    get_session,
+)
+
+
+def fields_etag(fields):
+    """Strong ETag for a field list; field lists never change once a session is built"""
+    digest = hashlib.sha256(json.dumps(fields, sort_keys=True, separators=(",", ":")).encode())
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+class CachedSession:
+    """Cached immutable session data plus the current_index read from the DB for this request"""
+
+    def __init__(self, session_id, fields, image_width, image_height, current_index, etag, user_id=""):
+        self.session_id = session_id
+        self.fields = fields
+        self.image_width = image_width
+        self.image_height = image_height
+        self.current_index = current_index
+        self.etag = etag
+        self.user_id = user_id
+
+
+class SessionCache:
+    """
+    Write-through cache in front of db/session.py.
+
+    A session's field list and image size never change after extraction, so
+    they are kept in memory (LRU with a TTL) instead of being decoded from the
+    fields JSON on every turn. current_index is mutable and shared between
+    gunicorn workers, so it is always read from the DB with a single-column
+    primary-key lookup and never cached.
+
+    When a session is rebuilt, create_or_update_session appends to the
+    session_invalidations log; every worker polls the log at most once per
+    poll_interval and drops the affected entries.
+    """
+
+    def __init__(self, max_entries=None, ttl=None, poll_interval=None):
+        self.max_entries = max_entries or config.SESSION_CACHE_MAX_ENTRIES
+        self.ttl = ttl or config.SESSION_CACHE_TTL
+        self.poll_interval = config.SESSION_CACHE_POLL_INTERVAL if poll_interval is None else poll_interval
+        self._entries = OrderedDict()  # session_id -> (expires_at, fields, image_width, image_height, etag, user_id)
+        self._last_invalidation_id = None
+        self._next_poll = 0.0
+        self._poll_lock = asyncio.Lock()
+
+    def _store(self, session_id, fields, image_width, image_height, user_id=""):
+        entry = (time.monotonic() + self.ttl, fields, image_width, image_height, fields_etag(fields), user_id)
+        self._entries[session_id] = entry
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        SESSION_CACHE_ENTRIES.set(len(self._entries))
+        return entry
+
+    def invalidate(self, session_id):
+        self._entries.pop(session_id, None)
+        SESSION_CACHE_ENTRIES.set(len(self._entries))
+
+    async def _sync_invalidations(self):
+        if time.monotonic() < self._next_poll:
+            return
+        async with self._poll_lock:
+            if time.monotonic() < self._next_poll:
+                return
+            self._next_poll = time.monotonic() + self.poll_interval
+            if self._last_invalidation_id is None:
+                # Nothing is cached yet, so only the log position matters
+                self._last_invalidation_id = await get_last_invalidation_id()
+                return
+            for invalidation_id, session_id in await get_invalidations_since(self._last_invalidation_id):
+                self.invalidate(session_id)
+                self._last_invalidation_id = invalidation_id
+
+    async def get(self, session_id: str) -> CachedSession | None:
+        await self._sync_invalidations()
+        entry = self._entries.get(session_id)
+        if entry and entry[0] > time.monotonic():
+            current_index = await get_current_index(session_id)
+            if current_index is None:
+                self.invalidate(session_id)
+                return None
+            SESSION_CACHE_LOOKUPS.labels("hit").inc()
+            self._entries.move_to_end(session_id)
+            return CachedSession(session_id, *entry[1:4], current_index, entry[4], entry[5])
+
+        SESSION_CACHE_LOOKUPS.labels("miss").inc()
+        session = await get_session(session_id)
+        if not session:
+            self.invalidate(session_id)
+            return None
+        entry = self._store(session_id, session.fields, session.image_width, session.image_height, session.user_id)
+        return CachedSession(session_id, *entry[1:4], session.current_index, entry[4], entry[5])
+
+    async def put(
+        self, session_id: str, fields: list, image_width: int, image_height: int, original_filename: str = "",
+        user_id: str = "", upload_sha256: str = "",
+    ):
+        """Write a built session through to the DB and cache its field list"""
+        await create_or_update_session(
+            session_id=session_id, fields=fields, image_width=image_width, image_height=image_height,
+            original_filename=original_filename, user_id=user_id, upload_sha256=upload_sha256,
+        )
+        self._store(session_id, fields, image_width, image_height, user_id)
+
+    def stats(self):
+        """Totals over every gunicorn worker, each of which caches its own sessions"""
+        lookups = metric_totals("formflow_session_cache_lookups", "outcome")
+        hits, misses = int(lookups.get("hit", 0)), int(lookups.get("miss", 0))
+        return {
+            "entries": int(metric_totals("formflow_session_cache_entries")),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+
+session_cache = SessionCache()
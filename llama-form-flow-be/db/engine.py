@@ -0,0 +1,76 @@
+import time
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
+
+import config
+from telemetry import DB_QUERY_SECONDS
+
+MEMORY_URL = "sqlite+aiosqlite:///:memory:"
+
+
+def _tune_sqlite(engine):
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if config.SQLITE_WAL:
+            # Readers no longer block the writer, so workers stop tripping over the db lock
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
+
+
+def _instrument(engine):
+    """Observe the latency of every statement in formflow_db_query_seconds"""
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        operation = statement.split(None, 1)[0].upper() if statement.strip() else ""
+        if operation not in ("SELECT", "INSERT", "UPDATE", "DELETE"):
+            operation = "OTHER"
+        DB_QUERY_SECONDS.labels(operation).observe(elapsed)
+
+
+def create_engine_from_url(url=None):
+    """
+    Build the async engine for a DATABASE_URL.
+
+    - "memory" (or any :memory: SQLite URL): a single shared in-process SQLite
+      connection, for tests and benchmarks
+    - sqlite+aiosqlite file URLs: pooled connections tuned with WAL,
+      synchronous=NORMAL and a busy timeout
+    - anything else is handed to SQLAlchemy with a pre-pinged connection pool
+    """
+    url = url or config.DATABASE_URL
+    if url == "memory" or ":memory:" in url:
+        engine = create_async_engine(
+            MEMORY_URL,
+            echo=config.DB_ECHO,
+            poolclass=StaticPool,
+            connect_args={"check_same_thread": False},
+        )
+    elif url.startswith("sqlite"):
+        engine = create_async_engine(
+            url,
+            echo=config.DB_ECHO,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            connect_args={"timeout": config.SQLITE_BUSY_TIMEOUT_MS / 1000},
+        )
+        _tune_sqlite(engine)
+    else:
+        engine = create_async_engine(
+            url,
+            echo=config.DB_ECHO,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_pre_ping=True,
+        )
+    _instrument(engine)
+    return engine
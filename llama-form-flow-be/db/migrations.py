@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, inspect, select
+from sqlalchemy.exc import DBAPIError
+
+from db.models import Base
+
+log = logging.getLogger(__name__)
+
+# Tracks which migrations have been applied; kept outside Base so it is never
+# created implicitly by a model import.
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", Float, nullable=False),
+)
+
+
+def _create_tables(*names):
+    """Create model tables as they are defined in db.models, skipping existing ones"""
+    def migrate(conn):
+        # Tables whose model was removed since are dropped again by a later migration
+        tables = [Base.metadata.tables[name] for name in names if name in Base.metadata.tables]
+        Base.metadata.create_all(conn, tables=tables, checkfirst=True)
+    return migrate
+
+
+def _add_column(table_name, column_name):
+    """Add a model column to an existing table unless it is already there"""
+    def migrate(conn):
+        existing = {c["name"] for c in inspect(conn).get_columns(table_name)}
+        if column_name in existing:
+            return
+        column = Base.metadata.tables[table_name].c[column_name]
+        ddl = f'ALTER TABLE {table_name} ADD COLUMN "{column_name}" {column.type.compile(dialect=conn.dialect)}'
+        if column.default is not None and not callable(column.default.arg):
+            ddl += f" DEFAULT {column.default.arg!r}"
+            if not column.nullable:
+                ddl += " NOT NULL"
+        conn.exec_driver_sql(ddl)
+    return migrate
+
+
+def _drop_table(table_name):
+    def migrate(conn):
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {table_name}")
+    return migrate
+
+
+def _create_index(table_name, column_name):
+    """Create the index a model declares on a column (index=True) unless it exists"""
+    def migrate(conn):
+        column = Base.metadata.tables[table_name].c[column_name]
+        for index in column.table.indexes:
+            if list(index.columns) == [column]:
+                index.create(conn, checkfirst=True)
+    return migrate
+
+
+def _detach_unissued_profiles(conn):
+    """Drop profile answers and session links keyed by ids that were never issued by POST /profile"""
+    issued = select(Base.metadata.tables["profiles"].c.id)
+    for table_name in ("profile_answers", "form_sessions", "form_jobs"):
+        table = Base.metadata.tables[table_name]
+        unissued = (table.c.user_id != "") & table.c.user_id.not_in(issued)
+        if table_name == "profile_answers":
+            conn.execute(table.delete().where(unissued))
+        else:
+            conn.execute(table.update().where(unissued).values(user_id=""))
+
+
+# Ordered list of (version, name, migrate(sync_connection)). Never edit or
+# reorder an applied migration; append a new one instead.
+MIGRATIONS = [
+    (1, "initial schema", _create_tables(
+        "form_sessions", "form_jobs", "form_fields", "form_answers", "session_invalidations",
+    )),
+    (2, "form_sessions.original_filename", _add_column("form_sessions", "original_filename")),
+    (3, "profile_answers", _create_tables("profile_answers")),
+    (4, "form_sessions.user_id", _add_column("form_sessions", "user_id")),
+    (5, "form_jobs.user_id", _add_column("form_jobs", "user_id")),
+    (6, "form_answers.source", _add_column("form_answers", "source")),
+    (7, "form_sessions.upload_sha256", _add_column("form_sessions", "upload_sha256")),
+    (8, "form_sessions.upload_sha256 index", _create_index("form_sessions", "upload_sha256")),
+    (9, "form_jobs.upload_sha256", _add_column("form_jobs", "upload_sha256")),
+    (10, "profiles", _create_tables("profiles")),
+    (11, "detach client-chosen profile ids", _detach_unissued_profiles),
+    (12, "form_jobs.lease_expires", _add_column("form_jobs", "lease_expires")),
+    # Only ever read by a helper no route used; session_cache serves field lists
+    (13, "drop form_fields", _drop_table("form_fields")),
+]
+
+
+def _run(conn):
+    schema_migrations.create(conn, checkfirst=True)
+    applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+    for version, name, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        log.info("Applying migration", extra={"version": version, "migration": name})
+        migrate(conn)
+        conn.execute(schema_migrations.insert().values(version=version, name=name, applied_at=time.time()))
+
+
+async def run_migrations(engine, attempts=3):
+    # Gunicorn workers start at the same time; whichever loses the race on the
+    # schema retries and then finds the migrations already applied
+    for attempt in range(attempts):
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(_run)
+            return
+        except DBAPIError:
+            if attempt == attempts - 1:
+                raise
+            await asyncio.sleep(0.5 * (attempt + 1))
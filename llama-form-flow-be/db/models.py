@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, JSON
+from sqlalchemy import Column, Integer, Float, String, Text, JSON, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -8,8 +8,70 @@ class FormSessionModel(Base):
 
     id = Column(Integer, primary_key=True)
     session_id = Column(String, unique=True, index=True)
-    fields = Column(JSON)  # list of field dicts
+    fields = Column(JSON)  # list of field dicts, written once when the session is built
     current_index = Column(Integer, default=0)
-    answers = Column(JSON, default=dict)
+    answers = Column(JSON, default=dict)  # legacy; answers now live in form_answers
     image_width = Column(Integer, nullable=False, default=0)
     image_height = Column(Integer, nullable=False, default=0)
+    original_filename = Column(String, nullable=False, default="")  # upload stored in uploads/<session_id>/
+    user_id = Column(String, nullable=False, default="")  # set when the user opted into profile memory
+    upload_sha256 = Column(String, nullable=False, default="", index=True)  # content hash of the upload, for de-duplication
+
+
+class FormAnswerModel(Base):
+    __tablename__ = "form_answers"
+    __table_args__ = (UniqueConstraint("session_id", "inputfield"),)
+
+    id = Column(Integer, primary_key=True)
+    session_id = Column(String, nullable=False, index=True)
+    field_index = Column(Integer, nullable=False)
+    inputfield = Column(String, nullable=False)
+    answer = Column(Text, nullable=False, default="")
+    source = Column(String, nullable=False, default="user")  # "profile" while a prefilled answer awaits confirmation
+
+
+class FormJobModel(Base):
+    __tablename__ = "form_jobs"
+
+    id = Column(Integer, primary_key=True)
+    session_id = Column(String, unique=True, index=True)
+    filename = Column(String, nullable=False)
+    stage = Column(String, nullable=False, default="uploaded")  # uploaded, rendered, extracting, ready, failed
+    error = Column(Text, nullable=False, default="")
+    attempts = Column(Integer, nullable=False, default=0)
+    updated_at = Column(Float, nullable=False, default=0.0)
+    user_id = Column(String, nullable=False, default="")
+    upload_sha256 = Column(String, nullable=False, default="")
+    # Renewed by the worker holding the job (queued or running); a lapsed lease means it was orphaned
+    lease_expires = Column(Float, nullable=False, default=0.0)
+
+
+class SessionInvalidationModel(Base):
+    """Append-only log other workers poll to drop cached copies of rebuilt sessions"""
+    __tablename__ = "session_invalidations"
+
+    id = Column(Integer, primary_key=True)
+    session_id = Column(String, nullable=False)
+    created_at = Column(Float, nullable=False, default=0.0)
+
+
+class ProfileModel(Base):
+    """A profile issued by POST /profile; the id is the SHA-256 of its token, which only the client holds"""
+    __tablename__ = "profiles"
+
+    id = Column(String, primary_key=True)
+    created_at = Column(Float, nullable=False, default=0.0)
+
+
+class ProfileAnswerModel(Base):
+    """Answers a user gave before, keyed by normalized label, for prefilling later forms"""
+    __tablename__ = "profile_answers"
+    # The unique constraint doubles as the (user_id, label_key) lookup index
+    __table_args__ = (UniqueConstraint("user_id", "label_key"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String, nullable=False)
+    label_key = Column(String, nullable=False)
+    label = Column(String, nullable=False, default="")
+    answer = Column(Text, nullable=False, default="")
+    updated_at = Column(Float, nullable=False, default=0.0)
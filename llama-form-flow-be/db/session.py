@@ -1,28 +1,36 @@
 import json
+import time
+from sqlalchemy import delete, func, update
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.future import select
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from db.models import Base, FormSessionModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.models import FormSessionModel, FormAnswerModel, FormJobModel, ProfileAnswerModel, ProfileModel, SessionInvalidationModel
 
-DATABASE_URL = "sqlite+aiosqlite:///./form_sessions.db"
+from db.engine import create_engine_from_url
+from db.migrations import run_migrations
 
-engine = create_async_engine(DATABASE_URL, echo=False)
+engine = create_engine_from_url()
 SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
 
 async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    await run_migrations(engine)
 
 async def get_session(session_id: str) -> FormSessionModel | None:
     async with SessionLocal() as db:
         result = await db.execute(select(FormSessionModel).where(FormSessionModel.session_id == session_id))
         return result.scalar_one_or_none()
 
-async def create_or_update_session(session_id: str, fields: list, image_width: int, image_height: int):
+async def create_or_update_session(
+    session_id: str, fields: list, image_width: int, image_height: int, original_filename: str = "", user_id: str = "",
+    upload_sha256: str = "",
+):
     async with SessionLocal() as db:
-        session = await get_session(session_id)
+        result = await db.execute(select(FormSessionModel).where(FormSessionModel.session_id == session_id))
+        session = result.scalar_one_or_none()
         if session:
             session.fields = fields
+            # Tell other workers their cached field list is stale
+            db.add(SessionInvalidationModel(session_id=session_id, created_at=time.time()))
         else:
             session = FormSessionModel(
                 session_id=session_id,
@@ -30,17 +38,229 @@ async def create_or_update_session(session_id: str, fields: list, image_width: i
                 current_index=0,
                 answers={},
                 image_width=image_width,
-                image_height=image_height
+                image_height=image_height,
+                original_filename=original_filename,
+                user_id=user_id,
+                upload_sha256=upload_sha256,
             )
             db.add(session)
         await db.commit()
 
-async def update_session_answer(session_id: str, field_name: str, answer: str):
+
+async def get_current_index(session_id: str) -> int | None:
     async with SessionLocal() as db:
-        session = await get_session(session_id)
-        if session:
-            session.answers[field_name] = answer
-            session.current_index += 1
-            await db.merge(session)
-            await db.commit()
-        return session
+        result = await db.execute(select(FormSessionModel.current_index).where(FormSessionModel.session_id == session_id))
+        return result.scalar_one_or_none()
+
+
+async def get_invalidations_since(last_id: int) -> list[tuple[int, str]]:
+    async with SessionLocal() as db:
+        result = await db.execute(
+            select(SessionInvalidationModel.id, SessionInvalidationModel.session_id)
+            .where(SessionInvalidationModel.id > last_id)
+            .order_by(SessionInvalidationModel.id)
+        )
+        return [tuple(row) for row in result.all()]
+
+
+async def get_last_invalidation_id() -> int:
+    async with SessionLocal() as db:
+        result = await db.execute(select(func.max(SessionInvalidationModel.id)))
+        return result.scalar_one() or 0
+
+
+async def record_answers(session_id: str, expected_index: int, answers: list[tuple[int, str, str]], discard: list[str] = ()) -> int | None:
+    """
+    Store several (field_index, field_name, answer) rows and move current_index
+    from expected_index to the first field that still has no answer, all in one
+    transaction. Fields answered ahead of the current one are skipped when the
+    conversation reaches them; prefilled answers not yet confirmed do not count.
+    Unconfirmed prefills of the fields in `discard` are deleted. Returns the new
+    current_index, or None without writing anything when the session is no
+    longer at expected_index.
+    """
+    async with SessionLocal() as db:
+        result = await db.execute(
+            select(FormAnswerModel.field_index)
+            .where(
+                FormAnswerModel.session_id == session_id,
+                FormAnswerModel.field_index > expected_index,
+                FormAnswerModel.source != "profile",
+            )
+        )
+        answered = set(result.scalars()) | {field_index for field_index, _, _ in answers}
+        next_index = expected_index
+        while next_index in answered:
+            next_index += 1
+
+        result = await db.execute(
+            update(FormSessionModel)
+            .where(FormSessionModel.session_id == session_id, FormSessionModel.current_index == expected_index)
+            .values(current_index=next_index)
+        )
+        if result.rowcount != 1:
+            await db.rollback()
+            return None
+        for field_index, field_name, answer in answers:
+            result = await db.execute(
+                update(FormAnswerModel)
+                .where(FormAnswerModel.session_id == session_id, FormAnswerModel.inputfield == field_name)
+                .values(answer=answer, field_index=field_index, source="user")
+            )
+            if result.rowcount == 0:
+                db.add(FormAnswerModel(session_id=session_id, field_index=field_index, inputfield=field_name, answer=answer))
+        if discard:
+            await db.execute(
+                delete(FormAnswerModel).where(
+                    FormAnswerModel.session_id == session_id,
+                    FormAnswerModel.inputfield.in_(discard),
+                    FormAnswerModel.source == "profile",
+                )
+            )
+        await db.commit()
+        return next_index
+
+
+async def get_session_answers(session_id: str) -> dict:
+    async with SessionLocal() as db:
+        result = await db.execute(select(FormSessionModel.answers).where(FormSessionModel.session_id == session_id))
+        answers = dict(result.scalar_one_or_none() or {})
+        result = await db.execute(
+            select(FormAnswerModel.inputfield, FormAnswerModel.answer)
+            .where(FormAnswerModel.session_id == session_id, FormAnswerModel.source != "profile")
+            .order_by(FormAnswerModel.field_index)
+        )
+        answers.update(result.all())
+        return answers
+
+
+async def get_prefilled_answers(session_id: str) -> list[tuple[int, str, str]]:
+    """(field_index, field_name, answer) of prefilled answers awaiting confirmation"""
+    async with SessionLocal() as db:
+        result = await db.execute(
+            select(FormAnswerModel.field_index, FormAnswerModel.inputfield, FormAnswerModel.answer)
+            .where(FormAnswerModel.session_id == session_id, FormAnswerModel.source == "profile")
+            .order_by(FormAnswerModel.field_index)
+        )
+        return [tuple(row) for row in result.all()]
+
+
+async def prefill_answers(session_id: str, user_id: str, wanted: list[tuple[int, str, str]]) -> int:
+    """
+    Look up the profile answers of user_id for the given (field_index,
+    field_name, label_key) entries in one query and store the matches as
+    unconfirmed answers. Returns the number of fields prefilled.
+    """
+    keys = {label_key for _, _, label_key in wanted}
+    if not keys:
+        return 0
+    async with SessionLocal() as db:
+        result = await db.execute(
+            select(ProfileAnswerModel.label_key, ProfileAnswerModel.answer)
+            .where(ProfileAnswerModel.user_id == user_id, ProfileAnswerModel.label_key.in_(keys))
+        )
+        known = dict(result.all())
+        rows = [
+            FormAnswerModel(session_id=session_id, field_index=i, inputfield=name, answer=known[key], source="profile")
+            for i, name, key in wanted if known.get(key)
+        ]
+        db.add_all(rows)
+        await db.commit()
+        return len(rows)
+
+
+async def create_profile(profile_id: str):
+    async with SessionLocal() as db:
+        db.add(ProfileModel(id=profile_id, created_at=time.time()))
+        await db.commit()
+
+
+async def profile_exists(profile_id: str) -> bool:
+    async with SessionLocal() as db:
+        result = await db.execute(select(ProfileModel.id).where(ProfileModel.id == profile_id))
+        return result.scalar_one_or_none() is not None
+
+
+async def remember_profile_answers(user_id: str, answers: list[tuple[str, str, str]]):
+    """Upsert (label_key, label, answer) entries into the profile of user_id"""
+    now = time.time()
+    async with SessionLocal() as db:
+        for label_key, label, answer in answers:
+            result = await db.execute(
+                update(ProfileAnswerModel)
+                .where(ProfileAnswerModel.user_id == user_id, ProfileAnswerModel.label_key == label_key)
+                .values(label=label, answer=answer, updated_at=now)
+            )
+            if result.rowcount == 0:
+                db.add(ProfileAnswerModel(user_id=user_id, label_key=label_key, label=label, answer=answer, updated_at=now))
+        await db.commit()
+
+JOB_FINAL_STAGES = ("ready", "failed")
+
+async def create_job(
+    session_id: str, filename: str, user_id: str = "", upload_sha256: str = "", lease_seconds: float = 0.0
+) -> FormJobModel:
+    now = time.time()
+    async with SessionLocal() as db:
+        job = FormJobModel(
+            session_id=session_id, filename=filename, stage="uploaded", error="", attempts=0, updated_at=now,
+            user_id=user_id, upload_sha256=upload_sha256, lease_expires=now + lease_seconds,
+        )
+        db.add(job)
+        await db.commit()
+        return job
+
+async def get_job(session_id: str) -> FormJobModel | None:
+    async with SessionLocal() as db:
+        result = await db.execute(select(FormJobModel).where(FormJobModel.session_id == session_id))
+        return result.scalar_one_or_none()
+
+async def update_job_stage(session_id: str, stage: str, error: str = ""):
+    async with SessionLocal() as db:
+        await db.execute(
+            update(FormJobModel)
+            .where(FormJobModel.session_id == session_id)
+            .values(stage=stage, error=error, updated_at=time.time())
+        )
+        await db.commit()
+
+async def renew_job_leases(session_ids: list[str], lease_seconds: float):
+    """Extend the leases of jobs this worker still holds, queued or running"""
+    async with SessionLocal() as db:
+        await db.execute(
+            update(FormJobModel)
+            .where(FormJobModel.session_id.in_(session_ids), FormJobModel.stage.notin_(JOB_FINAL_STAGES))
+            .values(lease_expires=time.time() + lease_seconds)
+        )
+        await db.commit()
+
+async def claim_stale_jobs(lease_seconds: float, max_attempts: int) -> list[FormJobModel]:
+    """
+    Claim unfinished jobs whose lease has lapsed because no worker renews it
+    any more (e.g. the worker was restarted), taking a fresh lease on them.
+    The conditional update on lease_expires makes sure only one worker wins
+    each job.
+    """
+    now = time.time()
+    claimed = []
+    async with SessionLocal() as db:
+        result = await db.execute(
+            select(FormJobModel).where(
+                FormJobModel.stage.notin_(JOB_FINAL_STAGES),
+                FormJobModel.lease_expires < now,
+            )
+        )
+        for job in result.scalars().all():
+            if job.attempts >= max_attempts:
+                values = {"stage": "failed", "error": "Job abandoned after too many attempts"}
+            else:
+                values = {"attempts": job.attempts + 1}
+            claim = await db.execute(
+                update(FormJobModel)
+                .where(FormJobModel.id == job.id, FormJobModel.lease_expires == job.lease_expires)
+                .values(lease_expires=now + lease_seconds, **values)
+            )
+            if claim.rowcount == 1 and "stage" not in values:
+                claimed.append(job)
+        await db.commit()
+    return claimed
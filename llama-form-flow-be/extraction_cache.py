@@ -0,0 +1,145 @@
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import config
+
+
+def image_cache_key(image, namespace=""):
+    """Hash of the decoded page pixels, so re-encoded copies of a render still match"""
+    digest = hashlib.sha256()
+    digest.update(namespace.encode())
+    digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class _Abandoned(Exception):
+    """Set on an in-flight extraction whose caller was cancelled, so the callers it coalesced retry"""
+
+
+class ExtractionCache:
+    """
+    LRU cache of extracted field lists keyed by content hash.
+
+    Entries are kept in memory up to max_entries / max_bytes and written to
+    cache_dir as one JSON file per key, so they survive restarts and are shared
+    between gunicorn workers. The directory is bounded by the same limits,
+    evicting the least recently used files first.
+
+    get_or_extract() coalesces concurrent misses for the same key into a single
+    extraction call within the worker.
+    """
+
+    def __init__(self, cache_dir=None, max_entries=None, max_bytes=None):
+        self.cache_dir = Path(cache_dir or config.EXTRACTION_CACHE_DIR)
+        self.max_entries = max_entries or config.EXTRACTION_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or config.EXTRACTION_CACHE_MAX_BYTES
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # get/put run on to_thread workers; the lock guards _entries and _bytes, not the disk
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (fields, size)
+        self._bytes = 0
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.json"
+
+    def _remember(self, key, fields, size):
+        """Caller holds _lock"""
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (fields, size)
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+        path = self._path(key)
+        try:
+            raw = path.read_bytes()
+            fields = json.loads(raw)
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)  # mark as recently used for disk eviction
+        except OSError:
+            pass  # evicted by another worker since; the copy read is still good
+        with self._lock:
+            self._remember(key, fields, len(raw))
+        return fields
+
+    def put(self, key, fields):
+        raw = json.dumps(fields).encode()
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(raw)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._remember(key, fields, len(raw))
+        self._evict_disk()
+
+    def _evict_disk(self):
+        files = []
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        while files and (len(files) > self.max_entries or total > self.max_bytes):
+            _, size, path = files.pop(0)
+            path.unlink(missing_ok=True)
+            total -= size
+
+    async def get_or_extract(self, key, extract):
+        """Return the cached fields for key, or await extract() once for all concurrent callers"""
+        while True:
+            fields = await asyncio.to_thread(self.get, key)
+            if fields is not None:
+                self.hits += 1
+                return copy.deepcopy(fields)
+            if key not in self._inflight:
+                break
+            try:
+                fields = await asyncio.shield(self._inflight[key])
+            except _Abandoned:
+                # Whoever started it went away (e.g. a streaming client disconnected); try again ourselves
+                continue
+            self.hits += 1
+            return copy.deepcopy(fields)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            fields = await extract()
+            await asyncio.to_thread(self.put, key, fields)
+            future.set_result(fields)
+            return copy.deepcopy(fields)
+        except asyncio.CancelledError:
+            # Cancelling the future would cancel every waiter with it
+            future.set_exception(_Abandoned(key))
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else is waiting
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
@@ -1,3 +1,23 @@
+import os
+import shutil
+
 bind = "0.0.0.0:8000"
 workers = 2
-timeout = 180
\ No newline at end of file
+timeout = 180
+
+# Workers write their metrics to files here so /metrics on any worker reports
+# the totals of all of them. Must be set before prometheus_client is imported.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/llama-form-flow-metrics")
+
+
+def on_starting(server):
+    # Files left by a previous run would be counted again
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
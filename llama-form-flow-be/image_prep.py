@@ -0,0 +1,147 @@
+import base64
+from io import BytesIO
+from PIL import Image
+
+import config
+from telemetry import span
+
+# Resolution pages are rasterized at; bounding boxes are stored in this pixel space
+RENDER_DPI = 300
+
+MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+BINARIZE_THRESHOLD = 180
+# Pixels darker than this count as content when cropping margins
+CONTENT_THRESHOLD = 245
+CROP_PADDING = 16
+
+
+class VisionImageSettings:
+    """How a rendered page is shrunk and encoded before it is sent to the vision model"""
+
+    def __init__(self, max_edge=None, grayscale=None, binarize=None, crop_margins=None, format=None, quality=None):
+        self.max_edge = config.VISION_MAX_EDGE if max_edge is None else max_edge
+        self.grayscale = config.VISION_GRAYSCALE if grayscale is None else grayscale
+        self.binarize = config.VISION_BINARIZE if binarize is None else binarize
+        self.crop_margins = config.VISION_CROP_MARGINS if crop_margins is None else crop_margins
+        self.format = (format or config.VISION_FORMAT).lower().replace("jpg", "jpeg")
+        self.quality = quality or config.VISION_QUALITY
+        if self.format not in MIME_TYPES:
+            raise ValueError(f"Unsupported vision image format: {self.format}")
+
+    def signature(self):
+        """Stable description of the settings, used to namespace cache keys"""
+        return (
+            f"edge={self.max_edge};gray={int(self.grayscale)};bin={int(self.binarize)};"
+            f"crop={int(self.crop_margins)};fmt={self.format};q={self.quality}"
+        )
+
+
+class PreparedImage:
+    """
+    Encoded payload plus the transform back to the source page.
+    A point (x, y) in the prepared image is (x / scale + offset_x, y / scale + offset_y)
+    on the original render.
+    """
+
+    def __init__(self, data, mime_type, width, height, scale, offset_x, offset_y, source_width, source_height):
+        self.data = data
+        self.mime_type = mime_type
+        self.width = width
+        self.height = height
+        self.scale = scale
+        self.offset_x = offset_x
+        self.offset_y = offset_y
+        self.source_width = source_width
+        self.source_height = source_height
+
+    def data_url(self):
+        with span("base64"):
+            return f"data:{self.mime_type};base64,{base64.b64encode(self.data).decode()}"
+
+    def to_source_box(self, box):
+        """Map an [x, y, width, height] box from the prepared image onto the original render"""
+        x, y, w, h = (float(v) for v in box[:4])
+        x = round(x / self.scale + self.offset_x)
+        y = round(y / self.scale + self.offset_y)
+        w = round(w / self.scale)
+        h = round(h / self.scale)
+        x = min(max(x, 0), self.source_width - 1)
+        y = min(max(y, 0), self.source_height - 1)
+        w = min(max(w, 0), self.source_width - x)
+        h = min(max(h, 0), self.source_height - y)
+        return [x, y, w, h]
+
+    def to_prepared_box(self, box):
+        """Map an [x, y, width, height] box from the original render into the prepared image"""
+        x, y, w, h = (float(v) for v in box[:4])
+        return [
+            round((x - self.offset_x) * self.scale),
+            round((y - self.offset_y) * self.scale),
+            round(w * self.scale),
+            round(h * self.scale),
+        ]
+
+
+def _content_bbox(gray):
+    mask = gray.point(lambda p: 255 if p < CONTENT_THRESHOLD else 0)
+    return mask.getbbox()
+
+
+def prepare_image(image, settings=None):
+    """Crop, scale and encode a page image according to settings"""
+    settings = settings or VisionImageSettings()
+    source_width, source_height = image.size
+    offset_x = offset_y = 0
+
+    gray = None
+    if settings.grayscale or settings.binarize or settings.crop_margins:
+        gray = image.convert("L")
+
+    if settings.crop_margins:
+        bbox = _content_bbox(gray)
+        if bbox:
+            left = max(bbox[0] - CROP_PADDING, 0)
+            top = max(bbox[1] - CROP_PADDING, 0)
+            right = min(bbox[2] + CROP_PADDING, source_width)
+            bottom = min(bbox[3] + CROP_PADDING, source_height)
+            image = image.crop((left, top, right, bottom))
+            gray = gray.crop((left, top, right, bottom))
+            offset_x, offset_y = left, top
+
+    if settings.grayscale or settings.binarize:
+        image = gray
+
+    scale = 1.0
+    if settings.max_edge and max(image.size) > settings.max_edge:
+        target = settings.max_edge / max(image.size)
+        unscaled_width = image.size[0]
+        size = (max(1, round(image.size[0] * target)), max(1, round(image.size[1] * target)))
+        image = image.resize(size, Image.LANCZOS)
+        # Use the realised scale so rounding does not skew the mapping
+        scale = image.size[0] / unscaled_width
+
+    if settings.binarize:
+        # Threshold after resampling so thin lines survive the downscale
+        image = image.point(lambda p: 255 if p > BINARIZE_THRESHOLD else 0)
+
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    buffer = BytesIO()
+    with span("image_encode"):
+        if settings.format == "png":
+            image.save(buffer, format="PNG", optimize=settings.binarize)
+        else:
+            image.save(buffer, format=settings.format.upper(), quality=settings.quality)
+
+    return PreparedImage(
+        buffer.getvalue(),
+        MIME_TYPES[settings.format],
+        image.size[0],
+        image.size[1],
+        scale,
+        offset_x,
+        offset_y,
+        source_width,
+        source_height,
+    )
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from pathlib import Path
+
+import config
+from db.session import claim_stale_jobs, renew_job_leases, update_job_stage
+from pipeline import build_form_session
+from telemetry import QUEUE_DEPTH, current_route
+
+log = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class ExtractionJobPool:
+    """
+    Bounded pool of background workers that build form sessions.
+
+    Job progress lives in the form_jobs table, so /form/status works from any
+    gunicorn worker and unfinished jobs are picked up again after a restart.
+    Every job held here, queued or running, has its lease renewed so no other
+    worker mistakes a slow or long-queued job for an orphaned one.
+    """
+
+    def __init__(self, extractor, upload_root: Path, workers=None, queue_size=None):
+        self.extractor = extractor
+        self.upload_root = upload_root
+        self.worker_count = workers or config.JOB_WORKERS
+        self.queue = asyncio.Queue(maxsize=queue_size or config.JOB_QUEUE_SIZE)
+        self._tasks = []
+        self._held = set()
+        self._stopping = False
+
+    async def start(self):
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+        self._tasks.append(asyncio.create_task(self._recover()))
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self):
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, session_id: str, filename: str, user_id: str = "", upload_sha256: str = ""):
+        try:
+            self.queue.put_nowait((session_id, filename, user_id, upload_sha256))
+        except asyncio.QueueFull:
+            raise JobQueueFull(f"Extraction queue is full ({self.queue.maxsize} jobs)")
+        self._held.add(session_id)
+        QUEUE_DEPTH.labels("jobs").inc()
+
+    async def _worker(self):
+        while True:
+            session_id, filename, user_id, upload_sha256 = await self.queue.get()
+            QUEUE_DEPTH.labels("jobs").dec()
+            try:
+                await self._run(session_id, filename, user_id, upload_sha256)
+            except asyncio.CancelledError:
+                if self._stopping:
+                    raise
+                # Cancelled from below rather than by stop(); keep the worker. The job's
+                # lease is no longer renewed, so recovery picks it up again once it lapses.
+                log.warning("Job cancelled", extra={"session_id": session_id})
+            finally:
+                self._held.discard(session_id)
+                self.queue.task_done()
+
+    async def _run(self, session_id: str, filename: str, user_id: str = "", upload_sha256: str = ""):
+        session_dir = self.upload_root / session_id
+        current_route.set("job")
+
+        async def on_stage(stage):
+            await update_job_stage(session_id, stage)
+
+        try:
+            await build_form_session(
+                self.extractor, session_id, session_dir, session_dir / filename, on_stage=on_stage, user_id=user_id,
+                upload_sha256=upload_sha256,
+            )
+        except Exception as e:
+            log.exception("Job failed", extra={"session_id": session_id})
+            await update_job_stage(session_id, "failed", error=str(e))
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(config.JOB_HEARTBEAT_INTERVAL)
+            if not self._held:
+                continue
+            try:
+                await renew_job_leases(list(self._held), config.JOB_STALE_SECONDS)
+            except Exception:
+                log.exception("Job lease renewal failed")
+
+    async def _recover(self):
+        while True:
+            try:
+                for job in await claim_stale_jobs(config.JOB_STALE_SECONDS, config.JOB_MAX_ATTEMPTS):
+                    log.info("Re-queueing orphaned job", extra={"session_id": job.session_id, "stage": job.stage})
+                    try:
+                        self.submit(job.session_id, job.filename, job.user_id, job.upload_sha256)
+                    except JobQueueFull:
+                        break
+            except Exception:
+                log.exception("Job recovery failed")
+            await asyncio.sleep(config.JOB_RECOVERY_INTERVAL)
@@ -0,0 +1,81 @@
+import json
+
+
+class JsonArrayParser:
+    """
+    Incremental parser for a JSON array of objects arriving in chunks.
+
+    feed() returns every object that closed in the new text, so callers can
+    act on fields while the model is still generating the rest. Anything
+    before the opening bracket (prose, a markdown fence) is skipped, and an
+    object that fails to parse is counted in `errors` and dropped rather than
+    failing the whole array.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start = None
+        self.started = False
+        self.done = False
+        self.errors = 0
+
+    def feed(self, text):
+        if self.done:
+            return []
+        self._buffer += text
+        objects = []
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer):
+            char = buffer[i]
+            if not self.started:
+                if char == "[":
+                    self.started = True
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0 and char == "{":
+                    self._object_start = i
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    if char == "]":
+                        self.done = True
+                        break
+                else:
+                    self._depth -= 1
+                    if self._depth == 0 and self._object_start is not None:
+                        try:
+                            value = json.loads(buffer[self._object_start:i + 1])
+                        except ValueError:
+                            value = None
+                        if isinstance(value, dict):
+                            objects.append(value)
+                        else:
+                            self.errors += 1
+                        self._object_start = None
+            i += 1
+
+        # Keep only the unfinished object, if any
+        keep_from = self._object_start if self._object_start is not None else i
+        self._buffer = buffer[keep_from:]
+        self._pos = i - keep_from
+        if self._object_start is not None:
+            self._object_start = 0
+        return objects
+
+    @property
+    def truncated(self):
+        """True when the text ended before the array was closed"""
+        return not self.done
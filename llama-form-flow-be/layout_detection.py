@@ -0,0 +1,158 @@
+import cv2
+import numpy as np
+
+# Geometry thresholds in pixels of a letter-width page rendered at 300 DPI;
+# detect_layout scales them to the actual image width
+REFERENCE_WIDTH = 2550
+MIN_LINE_LENGTH = 60
+CHECKBOX_MIN, CHECKBOX_MAX = 18, 90
+# How far a model-estimated edge may be from a rule line and still snap to it
+EDGE_TOLERANCE = 24
+CHECKBOX_DISTANCE = 45
+
+
+class PageLayout:
+    """Rule lines and checkbox squares detected on a page, each as an (N, 4) [x, y, w, h] array"""
+
+    def __init__(self, horizontal, vertical, checkboxes):
+        self.horizontal = horizontal
+        self.vertical = vertical
+        self.checkboxes = checkboxes
+
+    def fill_lines(self, page_width):
+        """Horizontal rules short enough to be answer lines rather than section separators"""
+        return self.horizontal[self.horizontal[:, 2] < page_width * 0.8]
+
+
+def _components(mask):
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    return stats[1:count, :4].astype(np.int32)  # drop the background component
+
+
+def _square(stats, scale):
+    w, h = stats[:, 2], stats[:, 3]
+    low, high = CHECKBOX_MIN * scale, CHECKBOX_MAX * scale
+    return (
+        (w >= low) & (w <= high) & (h >= low) & (h <= high)
+        & (np.abs(w - h) <= np.maximum(w, h) * 0.25)
+    )
+
+
+def detect_layout(image) -> PageLayout:
+    """
+    Find ruling lines and checkbox squares on a page image with morphology on
+    the whole page at once; filtering is vectorized over component statistics.
+    """
+    gray = np.asarray(image.convert("L"))
+    scale = gray.shape[1] / REFERENCE_WIDTH
+    line_length = max(int(MIN_LINE_LENGTH * scale), 10)
+    ink = cv2.adaptiveThreshold(~gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 15, -2)
+
+    horizontal = _components(cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (line_length, 1))))
+    vertical = _components(cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (1, line_length))))
+
+    # Checkbox outlines are too short for the line kernels: take square
+    # outlines whose hole fills most of the bounding box, which rules out
+    # letter bowls such as "o" or "D"
+    contours, hierarchy = cv2.findContours(ink, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    checkboxes = np.zeros((0, 4), np.int32)
+    if hierarchy is not None:
+        rects = np.array([cv2.boundingRect(c) for c in contours], np.int32).reshape(-1, 4)
+        parents = hierarchy[0][:, 3]
+        hole_area = np.zeros(len(rects))
+        inner = np.flatnonzero(parents >= 0)
+        np.maximum.at(hole_area, parents[inner], [cv2.contourArea(contours[i]) for i in inner])
+        fill = hole_area / np.maximum(rects[:, 2] * rects[:, 3], 1)
+        checkboxes = rects[(parents < 0) & _square(rects, scale) & (fill >= 0.55)]
+
+    return PageLayout(horizontal, vertical, checkboxes)
+
+
+def _nearest_line(positions, spans, target, tolerance):
+    gap = np.where(spans, np.abs(positions - target), np.inf)
+    return positions[gap.argmin()] if len(gap) and gap.min() <= tolerance else None
+
+
+def _snap_axis(start, end, other_start, other_end, lines, axis, tolerance):
+    """
+    Snap one axis of a box onto rule lines that cross its other axis. The far
+    edge (bottom/right) is where entry lines sit; the near edge only snaps if
+    the size stays plausible, so it does not jump onto the rule of the field
+    above or beside it.
+    """
+    if not len(lines):
+        return start, end, False
+    along = 1 - axis
+    positions = lines[:, axis] + lines[:, axis + 2] / 2
+    spans = (lines[:, along] < other_end) & (lines[:, along] + lines[:, along + 2] > other_start)
+    size = end - start
+    changed = False
+
+    far = _nearest_line(positions, spans, end, tolerance)
+    if far is not None:
+        end, changed = far, True
+    near = _nearest_line(positions, spans, start, tolerance)
+    if near is not None and size > 0 and 0.67 <= (end - near) / size <= 1.5:
+        start, changed = near, True
+    return start, end, changed
+
+
+def _snap_edges(box, horizontal, vertical, tolerance):
+    """Move the edges of an [x, y, w, h] box onto nearby rule lines; None if nothing is close"""
+    x1, y1, x2, y2 = box[0], box[1], box[0] + box[2], box[1] + box[3]
+    y1, y2, snapped_y = _snap_axis(y1, y2, x1, x2, horizontal, 1, tolerance)
+    x1, x2, snapped_x = _snap_axis(x1, x2, y1, y2, vertical, 0, tolerance)
+    if not (snapped_x or snapped_y) or x2 - x1 < 4 or y2 - y1 < 4:
+        return None
+    return [int(round(x1)), int(round(y1)), int(round(x2 - x1)), int(round(y2 - y1))]
+
+
+def _assign_checkboxes(boxes, squares, max_distance, claimed):
+    """Greedy one-to-one matching of estimated checkbox boxes to unclaimed squares by center distance"""
+    centers = boxes[:, :2] + boxes[:, 2:] / 2
+    square_centers = squares[:, :2] + squares[:, 2:] / 2
+    distance = np.linalg.norm(centers[:, None, :] - square_centers[None, :, :], axis=2)
+    matches = {}
+    for flat in np.argsort(distance, axis=None):
+        row, col = np.unravel_index(flat, distance.shape)
+        if distance[row, col] > max_distance:
+            break
+        if row in matches or col in claimed:
+            continue
+        matches[row] = col
+        claimed.add(col)
+    return matches
+
+
+def snap_boxes(fields, layout: PageLayout, tolerance=EDGE_TOLERANCE, checkbox_distance=CHECKBOX_DISTANCE, claimed=None):
+    """
+    Align model-estimated bounding boxes to the detected page geometry:
+    checkbox/radio fields move onto the nearest unclaimed checkbox square, and
+    the edges of other fields snap to nearby rule lines. Fields with nothing
+    close keep their box. Returns the number of boxes changed.
+
+    Pass the same `claimed` set across calls when snapping a page's fields a
+    few at a time, so two fields never take the same square.
+    """
+    claimed = set() if claimed is None else claimed
+    snapped = 0
+    checks, texts = [], []
+    for field in fields:
+        box = field.get("bounding_box")
+        if not isinstance(box, list) or len(box) < 4:
+            continue
+        kind = str(field.get("inputfield_type", "")).lower()
+        (checks if kind in ("checkbox", "radio") else texts).append(field)
+
+    if checks and len(layout.checkboxes):
+        boxes = np.array([[float(v) for v in f["bounding_box"][:4]] for f in checks])
+        for row, col in _assign_checkboxes(boxes, layout.checkboxes.astype(float), checkbox_distance, claimed).items():
+            checks[row]["bounding_box"] = [int(v) for v in layout.checkboxes[col]]
+            snapped += 1
+
+    for field in texts:
+        box = _snap_edges([float(v) for v in field["bounding_box"][:4]], layout.horizontal, layout.vertical, tolerance)
+        if box:
+            field["bounding_box"] = box
+            snapped += 1
+    return snapped
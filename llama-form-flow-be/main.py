@@ -1,25 +1,60 @@
-from fastapi import FastAPI, Request, UploadFile, File
-from fastapi.responses import FileResponse
-from db.session import init_db, get_session, create_or_update_session, update_session_answer
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from db.cache import session_cache
+from db.session import init_db, get_session, get_session_answers, record_answers, create_job, get_job, update_job_stage, JOB_FINAL_STAGES
 from contextlib import asynccontextmanager
 from pathlib import Path
+import asyncio
+import json
+import logging
+import shutil
 import uuid
-from PIL import Image
-from pdf2image import convert_from_path
 from fastapi.responses import JSONResponse
 
 from fastapi.middleware.cors import CORSMiddleware
 
 
 UPLOAD_ROOT = Path("uploads")
+STATUS_POLL_INTERVAL = 0.5
 
-from ai_extractor import FormExtraction
+import config
+from ai_client import LlamaClient, LLMUnavailable
+from answer_rules import validation_summary
 from ai_conversation import FormConversation
+from ai_extractor import FormExtraction
+from extraction_cache import ExtractionCache
+from template_index import TemplateIndex
+from jobs import ExtractionJobPool, JobQueueFull
+from pipeline import build_form_session, page_image_path
+from rasterizer import raster_pool
+from profile_memory import (
+    PROFILE_TOKEN_HEADER, confirmation_prompt, issue_profile, prefilled_fields, remember_answers, resolve_profile,
+)
+from pdf_export import export_filled_pdf, stream_zip
+from render_pyramid import MEDIA_TYPES, load_manifest, pick_derivative, scale_boxes
+from uploads import UploadRejected, receive_upload
+from telemetry import MetricsMiddleware, configure_logging, monitor_event_loop, render_metrics, span
+
+configure_logging()
+log = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
+    # One pooled async LLM client per worker, shared by every request
+    app.state.llm = LlamaClient()
+    templates = TemplateIndex() if config.TEMPLATE_MATCHING else None
+    app.state.extractor = FormExtraction(app.state.llm, cache=ExtractionCache(), templates=templates)
+    app.state.jobs = ExtractionJobPool(app.state.extractor, UPLOAD_ROOT)
+    await raster_pool.start()
+    await app.state.jobs.start()
+    lag_monitor = asyncio.create_task(monitor_event_loop(config.EVENT_LOOP_LAG_INTERVAL)) if config.EVENT_LOOP_LAG_INTERVAL else None
     yield
+    if lag_monitor:
+        lag_monitor.cancel()
+    await app.state.jobs.stop()
+    raster_pool.shutdown()
+    await app.state.llm.aclose()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -30,18 +65,73 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Content-Range", "Accept-Ranges"],
 )
+app.add_middleware(MetricsMiddleware)
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in tags
+
+
+def _compact(response: dict, session, index: int) -> dict:
+    """
+    Compact mode: drop the full field list and send only the field after
+    `index` plus progress counters. Clients fetch the list once from /form/restore.
+    """
+    response.pop("fields", None)
+    response["next_field"] = session.fields[index + 1] if index + 1 < len(session.fields) else None
+    response["progress"] = {"current_index": index, "field_count": len(session.fields)}
+    return response
+
 
 @app.get("/form/restore")
-async def restore_form(session_id: str):
-    session = await get_session(session_id)
+async def restore_form(request: Request, session_id: str):
+    session = await session_cache.get(session_id)
     if not session:
         return {"error": "Session not found"}
-    return {"session_id": session_id, "field_count": len(session.fields), "fields": session.fields}
+    # The field list never changes, so clients revalidate with If-None-Match
+    headers = {"ETag": session.etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), session.etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(
+        {"session_id": session_id, "field_count": len(session.fields), "fields": session.fields},
+        headers=headers,
+    )
+
+
+# The upload is streamed from the request body by receive_upload rather than
+# declared as an UploadFile parameter, so describe the body for the docs here
+_UPLOAD_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
+
 
+@app.post("/form/start", openapi_extra=_UPLOAD_BODY)
+async def start_form(request: Request, mode: str = "sync"):
+    # Users opt into profile memory with a token issued by POST /profile
+    user_id = ""
+    token = request.headers.get(PROFILE_TOKEN_HEADER)
+    if token and config.PROFILE_MEMORY:
+        user_id = await resolve_profile(token)
+        if not user_id:
+            return JSONResponse(status_code=401, content={"error": "Unknown profile token"})
 
-@app.post("/form/start")
-async def start_form(file: UploadFile = File(...)):
     # Step 1: Generate session ID
     session_id = str(uuid.uuid4())
 
@@ -49,40 +139,144 @@ async def start_form(file: UploadFile = File(...)):
     session_dir = UPLOAD_ROOT / session_id
     session_dir.mkdir(parents=True, exist_ok=True)
 
-    # Step 3: Save original uploaded file
-    original_path = session_dir / file.filename
-    with open(original_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
-
-    # Step 4: Convert to PNG
-    normalized_path = session_dir / "normalized.png"
-    print(f"Converting {original_path} to {normalized_path}")
-    if file.filename.lower().endswith(".pdf"):
-        images = convert_from_path(original_path, dpi=300)
-        images[0].save(normalized_path, "PNG")
-    else:
-        img = Image.open(original_path).convert("RGB")
-        img.save(normalized_path)
-
-    print(f"Converted {original_path} to {normalized_path}")
-    image_width, image_height = Image.open(normalized_path).size
-
-    # Step 5: Extract fields using your extractor
-    extratr = FormExtraction()
-    fields = extratr.extract_form_fields(normalized_path, session_dir)
-
-    print(f"Extracted {len(fields)} fields")
-
-    # Step 6: Store session in DB
-    await create_or_update_session(session_id=session_id, fields=fields, image_width=image_width, image_height=image_height)
-
-    print(f"Stored session {session_id} in DB")
-
-
-    print(f"Returning {session_id} with {len(fields)} fields")
-    return {"session_id": session_id, "field_count": len(fields), "fields": fields}
-
+    # Step 3: Stream the original upload to disk under a sanitized name
+    try:
+        with span("upload"):
+            upload = await receive_upload(request, session_dir)
+    except UploadRejected as e:
+        shutil.rmtree(session_dir, ignore_errors=True)
+        return JSONResponse(status_code=e.status_code, content={"error": str(e)})
+    original_path = upload.path
+    log.info("Upload stored", extra={"session_id": session_id, "bytes": upload.size, "sha256": upload.sha256})
+
+    # In async mode the rest of the pipeline runs on the job pool and the
+    # client follows progress through /form/status
+    if mode == "async":
+        await create_job(session_id, original_path.name, user_id, upload.sha256, lease_seconds=config.JOB_STALE_SECONDS)
+        try:
+            request.app.state.jobs.submit(session_id, original_path.name, user_id, upload.sha256)
+        except JobQueueFull as e:
+            await update_job_stage(session_id, "failed", error=str(e))
+            return JSONResponse(status_code=503, content={"error": str(e)})
+        return {"session_id": session_id, "stage": "uploaded"}
+
+    if mode == "stream":
+        return StreamingResponse(
+            _stream_form_build(request.app, session_id, session_dir, original_path, user_id, upload.sha256),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache"},
+        )
+
+    # Steps 4-6: Render, extract and store the session
+    fields = await build_form_session(
+        request.app.state.extractor, session_id, session_dir, original_path, user_id=user_id,
+        upload_sha256=upload.sha256,
+    )
+
+    log.info("Session built", extra={"session_id": session_id, "field_count": len(fields)})
+    response = {"session_id": session_id, "field_count": len(fields), "fields": fields}
+    if user_id:
+        prefilled = await prefilled_fields(session_id, fields)
+        response["prefilled"] = prefilled
+        response["confirmation"] = confirmation_prompt(prefilled)
+    return response
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _job_status(session_id: str):
+    job = await get_job(session_id)
+    if not job:
+        # Sessions built in sync mode have no job row
+        session = await session_cache.get(session_id)
+        if not session:
+            return None
+        return {"session_id": session_id, "stage": "ready", "error": "", "field_count": len(session.fields)}
+    status = {"session_id": session_id, "stage": job.stage, "error": job.error}
+    if job.stage == "ready":
+        session = await session_cache.get(session_id)
+        status["field_count"] = len(session.fields) if session else 0
+    return status
+
+
+async def _stream_form_build(app, session_id, session_dir, original_path, user_id="", upload_sha256=""):
+    """
+    Server-sent events for /form/start?mode=stream: a `field` event per field
+    as the vision reply is parsed, a `question` event with the prompt for the
+    form's first field (generated while the remaining fields are still being
+    extracted), then `ready` once the session is stored, or `error`.
+    """
+    queue = asyncio.Queue()
+    question = None
+
+    async def ask_first(field):
+        try:
+            prompt = await FormConversation(app.state.llm).get_next_field_prompt(field, "")
+            queue.put_nowait(_sse("question", {"field": field, "prompt": prompt}))
+        except Exception as e:
+            log.warning("Could not prepare the first question", extra={"session_id": session_id, "error": str(e)})
+
+    async def on_field(field):
+        nonlocal question
+        queue.put_nowait(_sse("field", field))
+        # The first page-1 field stays first in the merged list
+        if question is None and field.get("page") == 1:
+            question = asyncio.create_task(ask_first(field))
+
+    async def build():
+        try:
+            fields = await build_form_session(
+                app.state.extractor, session_id, session_dir, original_path, on_field=on_field, user_id=user_id,
+                upload_sha256=upload_sha256,
+            )
+            if question:
+                await question
+            queue.put_nowait(_sse("ready", {"session_id": session_id, "field_count": len(fields)}))
+        except Exception as e:
+            queue.put_nowait(_sse("error", {"error": str(e)}))
+        finally:
+            queue.put_nowait(None)
+
+    task = asyncio.create_task(build())
+    try:
+        yield _sse("session", {"session_id": session_id})
+        while (event := await queue.get()) is not None:
+            yield event
+    finally:
+        task.cancel()
+        if question:
+            question.cancel()
+
+
+@app.get("/form/status")
+async def form_status(session_id: str):
+    status = await _job_status(session_id)
+    if not status:
+        return {"error": "Session not found"}
+    return status
+
+
+@app.get("/form/status/stream")
+async def form_status_stream(session_id: str):
+    # Jobs may run in another worker, so follow the shared job row rather than
+    # in-process state and emit an event whenever the stage changes
+    async def events():
+        last_stage = None
+        while True:
+            status = await _job_status(session_id)
+            if not status:
+                yield _sse("error", {"error": "Session not found"})
+                return
+            if status["stage"] != last_stage:
+                last_stage = status["stage"]
+                yield _sse("stage", status)
+            if last_stage in JOB_FINAL_STAGES:
+                return
+            await asyncio.sleep(STATUS_POLL_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 
 # @app.post("/form/start")
@@ -92,37 +286,115 @@ async def start_form(file: UploadFile = File(...)):
 #     return {"session_id": session_id, "field_count": fields}
 
 @app.get("/form/render")
-async def render_form(session_id: str):
+async def render_form(request: Request, session_id: str, page: int = 1, width: int | None = None, format: str | None = None):
     session_dir = UPLOAD_ROOT / session_id
-    normalized_path = session_dir / "normalized.png"
-    # return the png image of the form
-    return FileResponse(normalized_path)
+    manifest = load_manifest(session_dir)
+    if manifest is None:
+        # Sessions built before render derivatives existed only have the PNGs
+        normalized_path = page_image_path(session_dir, page)
+        if not normalized_path.exists():
+            return JSONResponse(status_code=404, content={"error": "Page not found"})
+        # return the png image of the form
+        return FileResponse(normalized_path)
+
+    render = pick_derivative(manifest, page, width, format)
+    if not render:
+        return JSONResponse(status_code=404, content={"error": "Page not found"})
+    # Every render is written once and never changes, so it can be cached forever
+    headers = {"ETag": render["etag"], "Cache-Control": "public, max-age=31536000, immutable"}
+    if _etag_matches(request.headers.get("if-none-match"), render["etag"]):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(session_dir / render["file"], media_type=MEDIA_TYPES[render["format"]], headers=headers)
+
+
+@app.get("/form/render/manifest")
+async def render_manifest(session_id: str):
+    """Available renders per page, each with the page's bounding boxes scaled to its size"""
+    session = await session_cache.get(session_id)
+    manifest = load_manifest(UPLOAD_ROOT / session_id)
+    if not session or manifest is None:
+        return {"error": "Session not found"}
+    source_widths = {e["page"]: e["width"] for e in manifest if e["format"] == "png"}
+    return {
+        "session_id": session_id,
+        "renders": [
+            {
+                "page": e["page"],
+                "width": e["width"],
+                "height": e["height"],
+                "format": e["format"],
+                "etag": e["etag"],
+                "boxes": scale_boxes(session.fields, e["page"], source_widths.get(e["page"], e["width"]), e["width"]),
+            }
+            for e in manifest
+        ],
+    }
 
 @app.get("/form/next")
-async def get_next(session_id: str, last_response: str):
-    session = await get_session(session_id)
+async def get_next(request: Request, session_id: str, last_response: str, compact: bool = False):
+    with span("session_lookup"):
+        session = await session_cache.get(session_id)
     if not session:
         return {"error": "Session not found"}
     if session.current_index >= len(session.fields):
         return {"done": True}
     field = session.fields[session.current_index]
     # return {"field": field, "prompt": f"Can you provide {field['label']}?"}
-    return {
+    with span("question"):
+        prompt = await FormConversation(request.app.state.llm).get_next_field_prompt(field, last_response)
+    response = {
         "field": field, 
         "fields": session.fields,
-        "prompt": FormConversation().get_next_field_prompt(field, last_response)
+        "prompt": prompt
     }
+    if compact:
+        return _compact(response, session, session.current_index)
+    return response
+
+@app.get("/form/next/stream")
+async def get_next_stream(request: Request, session_id: str, last_response: str, compact: bool = False):
+    """
+    Streaming variant of /form/next. Emits a `field` event with the field
+    metadata first, then `token` events as the question is generated and a
+    final `prompt` event carrying the full question.
+    """
+    session = await session_cache.get(session_id)
+    if not session:
+        return {"error": "Session not found"}
+    if session.current_index >= len(session.fields):
+        return {"done": True}
+    field = session.fields[session.current_index]
+
+    async def events():
+        first = {"field": field, "fields": session.fields}
+        if compact:
+            first = _compact(first, session, session.current_index)
+        yield _sse("field", first)
+        parts = []
+        try:
+            async for text in FormConversation(request.app.state.llm).stream_next_field_prompt(field, last_response):
+                parts.append(text)
+                yield _sse("token", {"text": text})
+        except Exception as e:
+            yield _sse("error", {"error": str(e)})
+            return
+        yield _sse("prompt", {"prompt": "".join(parts).rstrip()})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 @app.post("/form/respond")
-async def respond(payload: dict):
+async def respond(request: Request, payload: dict):
     session_id = payload["session_id"]
     user_input = payload["user_input"]
     last_response = payload["last_response"]
 
-    session = await get_session(session_id)
+    with span("session_lookup"):
+        session = await session_cache.get(session_id)
     field = session.fields[session.current_index]
+    index = session.current_index
 
-    answer = FormConversation().get_next_field_answer(field, user_input, last_response)
+    with span("validate"):
+        answer = await FormConversation(request.app.state.llm).get_next_field_answer(field, user_input, last_response)
 
     response = {
         "done": False,
@@ -134,26 +406,246 @@ async def respond(payload: dict):
         "error": ""
     }
 
+    def reply(status_code=200):
+        if payload.get("compact"):
+            _compact(response, session, index)
+        if status_code != 200:
+            return JSONResponse(status_code=status_code, content=response)
+        return response
+
     if answer["is_followup"]:
         response["followup"] = answer["followup_prompt"]
-        return response
+        return reply()
     elif answer["is_valid"]:
-        await update_session_answer(session_id, field["inputfield"], answer["answer"])
-        if session.current_index + 1 >= len(session.fields):
+        with span("record_answer"):
+            next_index = await record_answers(session_id, index, [(index, field["inputfield"], answer["answer"])])
+        if next_index is None:
+            # Another request already answered this field
+            response["error"] = "This field was already answered"
+            return reply(409)
+        if session.user_id and config.PROFILE_MEMORY:
+            await remember_answers(session.user_id, [(field, answer["answer"])])
+        index = next_index
+        if next_index >= len(session.fields):
             response["done"] = True
             response["next"] = False
             response["followup"] = ""
-            return response
+            return reply()
         response["next"] = True
-        response["field"] = session.fields[session.current_index + 1]
-        return response
+        response["field"] = session.fields[next_index]
+        return reply()
     else:
         if answer["invalid_reason"] != "":
             response["error"] = answer["invalid_reason"]
         else:
             response["error"] = "Unknown error"
+        return reply()
+
+@app.post("/form/respond/bulk")
+async def respond_bulk(request: Request, payload: dict):
+    """
+    Let one message answer several fields, e.g. "John Doe, 123 Main St,
+    Springfield". The message is mapped onto the remaining fields in a single
+    LLM call, every valid value is stored in one transaction, and the session
+    moves to the first field still unanswered. Messages that match no field
+    are handled like /form/respond for the current field.
+    """
+    session_id = payload["session_id"]
+    user_input = payload["user_input"]
+    last_response = payload["last_response"]
+
+    session = await session_cache.get(session_id)
+    if not session:
+        return {"error": "Session not found"}
+    index = session.current_index
+    if index >= len(session.fields):
+        return {"done": True}
+
+    answered = await get_session_answers(session_id)
+    remaining = [
+        (i, field) for i, field in enumerate(session.fields[index:], start=index)
+        if field["inputfield"] not in answered
+    ][:config.BULK_MAX_FIELDS]
+    try:
+        results = await FormConversation(request.app.state.llm).get_bulk_answers(
+            [field for _, field in remaining], user_input, last_response
+        )
+    except LLMUnavailable as e:
+        log.warning("Bulk answer mapping unavailable", extra={"session_id": session_id, "error": str(e)})
+        results = []
+    if not results:
+        return await respond(request, payload)
+
+    positions = {field["inputfield"]: i for i, field in remaining}
+    filled = [r for r in results if r["is_valid"]]
+    rejected = [r for r in results if not r["is_valid"]]
+    response = {
+        "done": False,
+        "next": False,
+        "user_input": user_input,
+        "field": session.fields[index],
+        "fields": session.fields,
+        "filled": [{"inputfield": r["inputfield"], "answer": r["answer"]} for r in filled],
+        "rejected": [{"inputfield": r["inputfield"], "answer": r["answer"], "error": r["invalid_reason"]} for r in rejected],
+        "followup": "",
+        "error": "; ".join(r["invalid_reason"] for r in rejected if r["invalid_reason"]),
+    }
+
+    def reply(status_code=200):
+        if payload.get("compact"):
+            _compact(response, session, index)
+        if status_code != 200:
+            return JSONResponse(status_code=status_code, content=response)
         return response
 
+    if filled:
+        next_index = await record_answers(
+            session_id, index, [(positions[r["inputfield"]], r["inputfield"], r["answer"]) for r in filled]
+        )
+        if next_index is None:
+            response["error"] = "This field was already answered"
+            return reply(409)
+        if session.user_id and config.PROFILE_MEMORY:
+            await remember_answers(session.user_id, [(session.fields[positions[r["inputfield"]]], r["answer"]) for r in filled])
+        response["next"] = next_index != index
+        index = next_index
+        if next_index >= len(session.fields):
+            response["done"] = True
+            response["next"] = False
+            return reply()
+        response["field"] = session.fields[next_index]
+    return reply()
+
+
+@app.post("/profile")
+async def create_profile():
+    """Issue an opaque profile token; send it as X-Profile-Token to /form/start to prefill from earlier answers"""
+    if not config.PROFILE_MEMORY:
+        return JSONResponse(status_code=404, content={"error": "Profile memory is disabled"})
+    return {"profile_token": await issue_profile()}
+
+
+@app.get("/form/prefill")
+async def get_prefill(session_id: str):
+    """Answers prefilled from the user's profile that await confirmation, with one prompt covering all of them"""
+    session = await session_cache.get(session_id)
+    if not session:
+        return {"error": "Session not found"}
+    prefilled = await prefilled_fields(session_id, session.fields)
+    return {"session_id": session_id, "prefilled": prefilled, "confirmation": confirmation_prompt(prefilled)}
+
+
+@app.post("/form/prefill/confirm")
+async def confirm_prefill(payload: dict):
+    """
+    Settle the prefilled answers in one turn. `rejected` lists the inputfields
+    whose prefill is wrong; they are dropped and asked normally. The others
+    (or only those in `confirmed`, when given) become answers, and the session
+    moves to the first field still unanswered.
+    """
+    session_id = payload["session_id"]
+    session = await session_cache.get(session_id)
+    if not session:
+        return {"error": "Session not found"}
+    index = session.current_index
+
+    prefilled = await prefilled_fields(session_id, session.fields)
+    rejected = set(payload.get("rejected") or [])
+    confirmed = payload.get("confirmed")
+    accepted = [
+        item for item in prefilled
+        if item["inputfield"] not in rejected and (confirmed is None or item["inputfield"] in confirmed)
+    ]
+    next_index = await record_answers(
+        session_id, index,
+        [(item["field_index"], item["inputfield"], item["answer"]) for item in accepted],
+        discard=[item["inputfield"] for item in prefilled if item not in accepted],
+    )
+    if next_index is None:
+        return JSONResponse(status_code=409, content={"error": "The session moved on; fetch the prefill again"})
+
+    response = {
+        "done": next_index >= len(session.fields),
+        "next": next_index != index,
+        "confirmed": [item["inputfield"] for item in accepted],
+        "field": session.fields[next_index] if next_index < len(session.fields) else None,
+        "fields": session.fields,
+    }
+    if payload.get("compact"):
+        _compact(response, session, next_index)
+    return response
+
+
+async def _export_session(session_id: str) -> tuple[str, bytes] | None:
+    session = await get_session(session_id)
+    if not session:
+        return None
+    session_dir = UPLOAD_ROOT / session_id
+    original_path = session_dir / session.original_filename if session.original_filename else None
+    if not original_path or not original_path.is_file():
+        return None
+    answers = await get_session_answers(session_id)
+    pdf = await asyncio.to_thread(export_filled_pdf, original_path, session.fields, answers)
+    return f"{original_path.stem}-filled.pdf", pdf
+
+
+@app.get("/form/export")
+async def export_form(session_id: str):
+    exported = await _export_session(session_id)
+    if not exported:
+        return JSONResponse(status_code=404, content={"error": "Session not found"})
+    filename, pdf = exported
+    return Response(pdf, media_type="application/pdf", headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@app.post("/form/export/bulk")
+async def export_forms_bulk(payload: dict):
+    """Stream a ZIP of filled PDFs, one member per session, generated one at a time"""
+    session_ids = list(dict.fromkeys(payload.get("session_ids") or []))
+    if len(session_ids) > config.EXPORT_BULK_MAX:
+        return JSONResponse(status_code=400, content={"error": f"At most {config.EXPORT_BULK_MAX} sessions per export"})
+
+    async def members():
+        for session_id in session_ids:
+            exported = await _export_session(session_id)
+            if exported:
+                yield f"{session_id}/{exported[0]}", exported[1]
+
+    return StreamingResponse(
+        stream_zip(members()),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="forms.zip"'},
+    )
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics, aggregated across gunicorn workers"""
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
+
+@app.get("/stats/validation")
+async def validation_stats():
+    # Share of answers validated by local rules, over every worker
+    return validation_summary()
+
+
+@app.get("/stats/session-cache")
+async def session_cache_stats():
+    return session_cache.stats()
+
+
+@app.get("/stats/llm")
+async def llm_stats(request: Request):
+    return request.app.state.llm.stats()
+
+
+@app.get("/stats/templates")
+async def template_stats(request: Request):
+    templates = request.app.state.extractor.templates
+    return templates.stats() if templates else {"enabled": False}
+
 # @app.post("/form/respond")
 # async def respond(payload: dict):
 #     session_id = payload["session_id"]
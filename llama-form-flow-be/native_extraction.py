@@ -0,0 +1,218 @@
+import re
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+from image_prep import RENDER_DPI
+
+POINTS_TO_PIXELS = RENDER_DPI / 72
+# How far (in points) to look around a widget for its label
+ABOVE_DISTANCE = 14
+SIDE_GAP = 40
+
+WIDGET_TYPES = {
+    fitz.PDF_WIDGET_TYPE_CHECKBOX: "checkbox",
+    fitz.PDF_WIDGET_TYPE_RADIOBUTTON: "radio",
+    fitz.PDF_WIDGET_TYPE_SIGNATURE: "signature",
+}
+
+
+def _clean_label(text):
+    text = re.sub(r"(\s*\.){2,}", " ", text)  # dot leaders
+    text = re.sub(r"[\s$]+$", "", text)
+    text = re.sub(r"\s+\d+[a-z]?\s*(\([a-z]\))?$", "", text)  # trailing line numbers such as "2a" or "4(a)"
+    return " ".join(text.split())
+
+
+def normalize_label(label):
+    """'Step 1(a). First name:' -> 'First name'"""
+    text = re.sub(r"^(step\s*\d+\s*:?\s*)", "", label, flags=re.IGNORECASE)
+    text = re.sub(r"^(\(?[0-9]*[a-z]?\)|[0-9]+[a-z]?\.?)\s+", "", text, flags=re.IGNORECASE)
+    return text.strip(" :.-")
+
+
+def is_resolved(label):
+    """
+    Whether `label` reads as a whole label rather than the tail of a wrapped
+    line: 'employment', 'number (EIN)' or 'filing jointly):' start mid-sentence
+    or close a parenthesis opened on the line before.
+    """
+    # A lone letter in front is a line's enumerator, as in 'c Add lines 2a and 2b'
+    text = re.sub(r"^[a-z]\s+(?=[A-Z])", "", normalize_label(label))
+    if not re.search(r"[A-Za-z]{3,}", text):
+        return False
+    if text[0].islower():
+        return False
+    return text.count(")") <= text.count("(")
+
+
+def _lead_sentence(key, lines):
+    """
+    Right-aligned entry boxes sit at the end of a wrapped instruction, so the
+    words beside them are only its last line. Use the opening sentence of the
+    paragraph instead.
+    """
+    block, line = key
+    text = " ".join(
+        " ".join(word for _, _, word in sorted(lines[k][4]))
+        for k in sorted(k for k in lines if k[0] == block and k[1] <= line)
+    )
+    match = re.match(r"(.+?[.:])\s", _clean_label(text) + " ")
+    return match.group(1) if match else text
+
+
+def _lines(words):
+    lines = {}
+    for x0, y0, x1, y1, text, block, line, _ in words:
+        entry = lines.setdefault((block, line), [x0, y0, x1, y1, []])
+        entry[0], entry[1] = min(entry[0], x0), min(entry[1], y0)
+        entry[2], entry[3] = max(entry[2], x1), max(entry[3], y1)
+        entry[4].append((x0, x1, text))
+    return lines
+
+
+def _label_above(rect, lines):
+    best = None
+    for key, (x0, y0, x1, y1, words) in lines.items():
+        if not (rect.y0 - ABOVE_DISTANCE <= y1 <= rect.y0 + 2):
+            continue
+        overlapping = [text for wx0, wx1, text in sorted(words) if wx1 > rect.x0 - 2 and wx0 < rect.x1]
+        if overlapping and (best is None or y1 > best[0]):
+            best = (y1, key, " ".join(overlapping))
+    return (best[2], best[1]) if best else ("", None)
+
+
+def _words_beside(rect, words, side):
+    """Run of words on the widget's line directly left or right of it, in reading order"""
+    height = rect.height or 1
+    row = [
+        w for w in words
+        if min(w[3], rect.y1) - max(w[1], rect.y0) > min(height, w[3] - w[1]) * 0.5
+    ]
+    if side == "left":
+        row = sorted((w for w in row if w[2] <= rect.x0 + 1), key=lambda w: -w[2])
+        edge = rect.x0
+    else:
+        row = sorted((w for w in row if w[0] >= rect.x1 - 1), key=lambda w: w[0])
+        edge = rect.x1
+    picked = []
+    for w in row:
+        gap = edge - w[2] if side == "left" else w[0] - edge
+        if gap > SIDE_GAP:
+            break
+        picked.append(w)
+        edge = w[0] if side == "left" else w[2]
+    if side == "left":
+        picked.reverse()
+    return picked
+
+
+def _label_beside(rect, words, side):
+    picked = _words_beside(rect, words, side)
+    key = (picked[0][5], picked[0][6]) if picked else None
+    return " ".join(w[4] for w in picked), key
+
+
+def option_label(rect, words):
+    """Text printed right of a checkbox or radio widget, i.e. the option it stands for"""
+    return _clean_label(_label_beside(rect, words, "right")[0])
+
+
+def _context(key, blocks):
+    if key is None:
+        return ""
+    for block in blocks:
+        if block[5] == key[0]:
+            return " ".join(block[4].split())[:200]
+    return ""
+
+
+def _group_rect(options, words):
+    """Area covered by widgets sharing a name, with any of `words` printed right of them (a radio group's option labels)"""
+    rect = fitz.Rect(options[0].rect)
+    for option in options:
+        rect |= option.rect
+        for w in _words_beside(option.rect, words, "right"):
+            rect |= fitz.Rect(w[:4])
+    return rect
+
+
+def _radio_options(options, words):
+    """Printed label of each option of a radio group, or its export name when nothing is printed beside it"""
+    return list(dict.fromkeys(option_label(w.rect, words) or str(w.on_state()) for w in options))
+
+
+def _pixel_box(page, rect):
+    # Widget rects are in unrotated page space; renders follow the page rotation
+    rect = rect * page.rotation_matrix * POINTS_TO_PIXELS
+    return [round(rect.x0), round(rect.y0), round(rect.width), round(rect.height)]
+
+
+def extract_widget_fields(pdf_path: Path, page_number: int):
+    """
+    Fields of one page read from its AcroForm widgets, in the schema produced by
+    FormExtraction.extract_form_fields, with boxes in RENDER_DPI pixels.
+    Returns (fields, page_text); fields is empty when the page has no widgets.
+    Labels come from the text next to each widget; fields whose label could
+    not be worked out locally have "label_resolved": False.
+    """
+    with fitz.open(pdf_path) as doc:
+        page = doc[page_number - 1]
+        widgets = list(page.widgets())
+        if not widgets:
+            return [], ""
+        document_name = doc.metadata.get("title") or Path(pdf_path).stem
+        words = page.get_text("words")
+        blocks = page.get_text("blocks")
+        lines = _lines(words)
+        page_text = page.get_text()
+
+        fields = {}
+        for widget in widgets:
+            field_type = WIDGET_TYPES.get(widget.field_type, "text")
+            name = widget.field_name
+            if name in fields:
+                continue
+
+            # Radio buttons share one field name; keep one field covering every option.
+            # A box's label is printed right of it, but in a group of several that
+            # text names one option; the group's label sits above or left of it.
+            siblings = [w for w in widgets if w.field_name == name]
+            grouped = field_type == "radio" and len(siblings) > 1
+            rect = _group_rect(siblings, words if grouped else [])
+            first = min(siblings, key=lambda w: (w.rect.y0, w.rect.x0))
+
+            label, key = (widget.field_label or "").strip(), None
+            if not label and field_type in ("checkbox", "radio") and not grouped:
+                label, key = _label_beside(rect, words, "right")
+            if not is_resolved(label) and (field_type not in ("checkbox", "radio") or grouped):
+                label, key = _label_above(rect, lines)
+            if not is_resolved(label):
+                label, key = _label_beside(first.rect, words, "left")
+                if key and key[1] > 0:
+                    label = _lead_sentence(key, lines)
+            label = _clean_label(label)
+
+            lowered = label.lower()
+            if field_type == "text" and "date" in lowered:
+                field_type = "date"
+            elif field_type == "text" and "signature" in lowered:
+                field_type = "signature"
+
+            context = _context(key, blocks)
+            if grouped:
+                context = f"{context} Options: {', '.join(_radio_options(siblings, words))}".strip()
+
+            fields[name] = {
+                "inputfield": name,
+                "label": label,
+                "normalized_label": normalize_label(label),
+                "bounding_box": _pixel_box(page, rect),
+                "context": context,
+                "page": page_number,
+                "document_name": document_name,
+                "inputfield_type": field_type,
+                "inputfield_confidence": 1.0,
+                "label_resolved": is_resolved(label),
+            }
+        return list(fields.values()), page_text
@@ -0,0 +1,191 @@
+import re
+import zipfile
+from pathlib import Path
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from image_prep import RENDER_DPI
+from native_extraction import option_label
+
+# Field boxes are stored in RENDER_DPI pixels; PDF user space is 72 points per inch
+PIXELS_TO_POINTS = 72 / RENDER_DPI
+TRUTHY_ANSWERS = {"yes", "y", "true", "x", "checked", "check", "on", "1"}
+MAX_FONT_SIZE = 11
+MIN_FONT_SIZE = 5
+
+
+def _is_checked(answer) -> bool:
+    return str(answer).strip().lower().rstrip(".!") in TRUTHY_ANSWERS
+
+
+def _words(text) -> list:
+    return re.findall(r"[a-z0-9]+", str(text).lower())
+
+
+def _radio_choice(options: list, answer):
+    """
+    The option of a radio group (list of (widget, label) pairs) the answer
+    names: by export name or printed label, or as the only option starting
+    with the answer's words. A group of one option is chosen by a yes. None
+    when the answer names no option.
+    """
+    wanted = _words(answer)
+    if not wanted:
+        return None
+    for widget, label in options:
+        if wanted in (_words(widget.on_state()), _words(label)):
+            return widget
+    prefixed = [widget for widget, label in options if _words(label)[:len(wanted)] == wanted]
+    if len(prefixed) == 1:
+        return prefixed[0]
+    if len(options) == 1 and _is_checked(answer):
+        return options[0][0]
+    return None
+
+
+def _fill_widgets(doc, answers: dict) -> tuple:
+    """
+    Write answers into AcroForm widgets whose name matches an inputfield.
+    Returns the names filled and the radio groups whose answer named none of
+    their options.
+    """
+    filled, unmatched = set(), set()
+    radio_groups = {}
+    for page in doc:
+        words = None
+        for widget in page.widgets():
+            name = widget.field_name
+            if name not in answers:
+                continue
+            answer = answers[name]
+            if widget.field_type == fitz.PDF_WIDGET_TYPE_RADIOBUTTON:
+                # One widget per option under a shared name; settled below once every option is known
+                if words is None:
+                    words = page.get_text("words")
+                radio_groups.setdefault(name, []).append((widget, option_label(widget.rect, words)))
+                continue
+            if widget.field_type == fitz.PDF_WIDGET_TYPE_CHECKBOX:
+                widget.field_value = widget.on_state() if _is_checked(answer) else "Off"
+            else:
+                widget.field_value = str(answer)
+            widget.update()
+            filled.add(name)
+
+    for name, options in radio_groups.items():
+        chosen = _radio_choice(options, answers[name])
+        if chosen is None and len(options) > 1:
+            # Leave the group alone; the answer is written out over it instead
+            unmatched.add(name)
+            continue
+        # A lone option is just a box, left clear by anything but a yes. Radio kids
+        # take True/False (PyMuPDF reads any string, "Off" included, as on); the
+        # chosen one goes last since each update also rewrites the group's value.
+        chosen_xref = chosen.xref if chosen is not None else None
+        for widget, _ in sorted(options, key=lambda option: option[0].xref == chosen_xref):
+            widget.field_value = widget.xref == chosen_xref
+            widget.update()
+        filled.add(name)
+    return filled, unmatched
+
+
+def _field_rect(page, box):
+    x, y, w, h = (float(v) for v in box[:4])
+    rect = fitz.Rect(x, y, x + w, y + h) * PIXELS_TO_POINTS
+    if page.rotation:
+        # Boxes were measured on the rotated render; text is placed in unrotated page space
+        rect = rect * page.derotation_matrix
+    return rect
+
+
+def _overlay_text(page, field, answer, as_text=False):
+    """Draw an answer inside the field's box: a cross for a ticked box, else the text (always with as_text)"""
+    box = field.get("bounding_box")
+    if not isinstance(box, list) or len(box) < 4:
+        return
+    rect = _field_rect(page, box)
+    if not as_text and str(field.get("inputfield_type", "")).lower() in ("checkbox", "radio"):
+        if _is_checked(answer):
+            # A stroked cross fits any box size, unlike a glyph
+            inset = min(rect.width, rect.height) * 0.2
+            mark = fitz.Rect(rect.x0 + inset, rect.y0 + inset, rect.x1 - inset, rect.y1 - inset)
+            page.draw_line(mark.tl, mark.br, width=1)
+            page.draw_line(mark.tr, mark.bl, width=1)
+        return
+    text = str(answer)
+    size = max(MIN_FONT_SIZE, min(MAX_FONT_SIZE, rect.height * 0.7))
+    # Shrink until the answer fits its box; insert_textbox returns < 0 when it does not
+    while page.insert_textbox(rect, text, fontsize=size, fontname="helv", rotate=page.rotation) < 0:
+        if size <= MIN_FONT_SIZE:
+            # Write it anyway on one line rather than dropping the answer
+            page.insert_text(rect.bl + (0, -1), text, fontsize=MIN_FONT_SIZE, fontname="helv", rotate=page.rotation)
+            break
+        size = max(MIN_FONT_SIZE, size - 1)
+
+
+def _open_as_pdf(original_path: Path):
+    """The uploaded PDF itself, or a one-page PDF wrapping an uploaded image"""
+    if original_path.suffix.lower() == ".pdf":
+        return fitz.open(original_path)
+    doc = fitz.open()
+    with Image.open(original_path) as image:
+        width, height = image.size
+    # Size the page so one image pixel at RENDER_DPI maps onto the stored boxes
+    page = doc.new_page(width=width * PIXELS_TO_POINTS, height=height * PIXELS_TO_POINTS)
+    page.insert_image(page.rect, filename=str(original_path))
+    return doc
+
+
+def export_filled_pdf(original_path: Path, fields: list, answers: dict) -> bytes:
+    """
+    Write a session's answers into its original upload and return the PDF bytes.
+
+    Fields backed by AcroForm widgets get their widget values set; every other
+    answered field is drawn as vector text inside its bounding box. The page
+    content is never rasterized, so the output stays close to the input size.
+    """
+    with _open_as_pdf(original_path) as doc:
+        filled, unmatched = _fill_widgets(doc, answers) if doc.is_form_pdf else (set(), set())
+        for field in fields:
+            name = field.get("inputfield")
+            if name in filled or name not in answers or answers[name] in ("", None):
+                continue
+            page_number = int(field.get("page") or 1)
+            if not 1 <= page_number <= doc.page_count:
+                continue
+            # A cross over a whole radio group would not say which option was meant
+            _overlay_text(doc[page_number - 1], field, answers[name], as_text=name in unmatched)
+        return doc.tobytes(garbage=3, deflate=True)
+
+
+class _ChunkSink:
+    """Write-only, non-seekable file object that collects what zipfile writes"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+async def stream_zip(entries):
+    """
+    Stream a ZIP archive from an async iterator of (name, bytes) pairs.
+    Only the current member is held in memory; zipfile falls back to data
+    descriptors because the sink cannot seek.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        async for name, data in entries:
+            archive.writestr(name, data)
+            yield sink.drain()
+    yield sink.drain()
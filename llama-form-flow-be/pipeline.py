@@ -0,0 +1,140 @@
+import asyncio
+import logging
+from pathlib import Path
+
+import config
+import rasterizer
+from db.cache import session_cache
+from image_prep import RENDER_DPI
+from native_extraction import extract_widget_fields
+from profile_memory import prefill_session
+from render_pyramid import write_manifest
+from telemetry import span
+
+log = logging.getLogger(__name__)
+
+
+def page_image_path(session_dir: Path, page: int) -> Path:
+    # Page 1 keeps the historical normalized.png name used by /form/render
+    if page == 1:
+        return session_dir / "normalized.png"
+    return session_dir / f"page-{page}.png"
+
+
+def count_pages(original_path: Path) -> int:
+    with span("count_pages"):
+        return rasterizer.count_pages(original_path)
+
+
+def render_page(original_path: Path, page: int, output_path: Path):
+    """Rasterize a single page at RENDER_DPI in this process, save it as PNG and return the image"""
+    with span("rasterize"):
+        image = rasterizer.rasterize(original_path, page, RENDER_DPI)
+    with span("png_write"):
+        image.save(output_path, "PNG")
+    return image
+
+
+async def render_page_with_derivatives(original_path: Path, page: int, output_path: Path):
+    """render_page plus the preview derivatives served by /form/render, done on the raster pool"""
+    rendered = await rasterizer.raster_pool.render_page(original_path, page, output_path, RENDER_DPI)
+    return await asyncio.to_thread(rendered.image), rendered.entries
+
+
+def merge_page_fields(page_fields):
+    """Concatenate per-page field lists in page order, keeping inputfield names unique"""
+    merged = []
+    seen = set()
+    for fields in page_fields:
+        for field in fields:
+            name = field.get("inputfield") or "field"
+            if name in seen:
+                base = f"{name}_p{field['page']}"
+                name, suffix = base, 2
+                while name in seen:
+                    name = f"{base}_{suffix}"
+                    suffix += 1
+                field["inputfield"] = name
+            seen.add(name)
+            merged.append(field)
+    return merged
+
+
+async def build_form_session(
+    extractor, session_id: str, session_dir: Path, original_path: Path, on_stage=None, on_field=None, user_id: str = "",
+    upload_sha256: str = "",
+):
+    """
+    Render the uploaded file, extract its fields and store the session.
+    on_stage is awaited with each stage name as the build progresses, and
+    on_field with each field as soon as it is extracted (pages may interleave;
+    names are deduplicated across pages only in the returned list). With a
+    user_id, fields the user answered on earlier forms are prefilled from
+    their profile, pending confirmation.
+
+    Pages are rendered one at a time and extracted concurrently, at most
+    EXTRACTION_PAGE_CONCURRENCY at once, so only that many page images are held
+    in memory regardless of the page count.
+    """
+    async def report(stage):
+        if on_stage:
+            await on_stage(stage)
+
+    with span("count_pages"):
+        page_count = await rasterizer.raster_pool.count_pages(original_path)
+    if page_count > config.MAX_PAGES:
+        raise ValueError(f"Document has {page_count} pages, the limit is {config.MAX_PAGES}")
+
+    # Step 4: Convert the first page to PNG; its size is the session's coordinate system
+    normalized_path = page_image_path(session_dir, 1)
+    first_page, renders = await render_page_with_derivatives(original_path, 1, normalized_path)
+    image_width, image_height = first_page.size
+    log.info("Rendered first page", extra={"session_id": session_id, "page_count": page_count})
+    await report("rendered")
+
+    # Step 5: Extract fields page by page using your extractor
+    await report("extracting")
+    semaphore = asyncio.Semaphore(config.EXTRACTION_PAGE_CONCURRENCY)
+
+    native = config.NATIVE_EXTRACTION and original_path.suffix.lower() == ".pdf"
+
+    async def extract_page(page, image=None):
+        async with semaphore:
+            if image is None:
+                image, entries = await render_page_with_derivatives(
+                    original_path, page, page_image_path(session_dir, page)
+                )
+                renders.extend(entries)
+            if native:
+                # Fillable pages already describe their fields; skip the vision model
+                with span("native_fields"):
+                    fields, page_text = await asyncio.to_thread(extract_widget_fields, original_path, page)
+                if fields:
+                    fields = await extractor.resolve_field_labels(fields, page_text)
+                    if on_field:
+                        for field in fields:
+                            await on_field(field)
+                    return fields
+            return await extractor.extract_page_fields(image, page=page, on_field=on_field)
+
+    pages = [extract_page(1, first_page)]
+    del first_page
+    pages += [extract_page(page) for page in range(2, page_count + 1)]
+    fields = merge_page_fields(await asyncio.gather(*pages))
+    extractor.save_session_fields(session_dir, fields)
+    write_manifest(session_dir, renders)
+
+    log.info("Extracted fields", extra={"session_id": session_id, "field_count": len(fields), "page_count": page_count})
+
+    # Step 6: Store session in DB
+    with span("store_session"):
+        await session_cache.put(
+            session_id, fields, image_width, image_height, original_path.name, user_id, upload_sha256
+        )
+
+    if user_id and config.PROFILE_MEMORY:
+        with span("prefill"):
+            prefilled = await prefill_session(session_id, user_id, fields)
+        log.info("Prefilled fields from profile", extra={"session_id": session_id, "prefilled": prefilled})
+    await report("ready")
+    return fields
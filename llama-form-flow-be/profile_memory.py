@@ -0,0 +1,105 @@
+import hashlib
+import re
+import secrets
+
+from answer_rules import field_kind
+from db.session import create_profile, get_prefilled_answers, prefill_answers, profile_exists, remember_profile_answers
+
+# Request header carrying the token issued by POST /profile
+PROFILE_TOKEN_HEADER = "X-Profile-Token"
+
+# Labels whose answer belongs to one form only and must never be carried over
+ONE_OFF_LABELS = {"date", "today s date", "todays date", "date signed", "signature", "initials"}
+# Answers too sensitive to keep: identification numbers and money figures. The
+# pattern also catches labels field_kind leaves unclassified ("1a Wages, tips, ...").
+SENSITIVE_KINDS = {"ssn", "ein", "currency"}
+SENSITIVE_LABEL_RE = re.compile(
+    r"social security|\bssn\b|employer identification|\bein\b|taxpayer|\b(i?tin)\b|account|routing|"
+    r"passport|licen[cs]e|amount|wages|income|salary|compensation|\$"
+)
+
+
+def profile_id(token: str) -> str:
+    """Stored form of a profile token; the token itself is never written to the database"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def issue_profile() -> str:
+    """Create a profile and return its opaque token"""
+    token = secrets.token_urlsafe(32)
+    await create_profile(profile_id(token))
+    return token
+
+
+async def resolve_profile(token: str) -> str | None:
+    """Profile id of an issued token, or None for a token the server never issued"""
+    if not token:
+        return None
+    key = profile_id(token)
+    return key if await profile_exists(key) else None
+
+
+def label_key(field):
+    """Profile lookup key of a field: its normalized label, lowercased and stripped of punctuation"""
+    label = str(field.get("normalized_label") or field.get("label") or "")
+    return " ".join(re.findall(r"[a-z0-9]+", label.lower()))
+
+
+def rememberable(field):
+    """Whether an answer to this field is worth reusing on another form"""
+    kind = field_kind(field)
+    if kind in ("checkbox", "radio") or kind in SENSITIVE_KINDS:
+        return False
+    if SENSITIVE_LABEL_RE.search(str(field.get("normalized_label") or field.get("label") or "").lower()):
+        return False
+    if str(field.get("inputfield_type") or "").lower() == "signature":
+        return False
+    key = label_key(field)
+    return bool(key) and key not in ONE_OFF_LABELS
+
+
+async def prefill_session(session_id: str, user_id: str, fields: list) -> int:
+    """Prefill the fields of a new session from the user's profile; returns the number prefilled"""
+    wanted = [
+        (i, field.get("inputfield", ""), label_key(field))
+        for i, field in enumerate(fields)
+        if rememberable(field)
+    ]
+    return await prefill_answers(session_id, user_id, wanted)
+
+
+async def remember_answers(user_id: str, answers: list[tuple[dict, str]]):
+    """Store (field, answer) pairs in the user's profile, skipping one-off and empty answers"""
+    entries = {}
+    for field, answer in answers:
+        if answer and rememberable(field):
+            label = field.get("normalized_label") or field.get("label") or ""
+            entries[label_key(field)] = (label_key(field), label, answer)
+    if entries:
+        await remember_profile_answers(user_id, list(entries.values()))
+
+
+async def prefilled_fields(session_id: str, fields: list) -> list[dict]:
+    """Prefilled answers of a session that still await confirmation"""
+    return [
+        {
+            "field_index": i,
+            "inputfield": name,
+            "label": fields[i].get("normalized_label") or fields[i].get("label") or name,
+            "answer": answer,
+        }
+        for i, name, answer in await get_prefilled_answers(session_id)
+        if i < len(fields)
+    ]
+
+
+def confirmation_prompt(prefilled: list[dict]) -> str:
+    """One message asking the user to confirm every prefilled answer at once"""
+    if not prefilled:
+        return ""
+    lines = [f"- {item['label']}: {item['answer']}" for item in prefilled]
+    return (
+        "I filled in these answers from your previous forms:\n"
+        + "\n".join(lines)
+        + "\nAre they all still correct? Tell me which ones to change, if any."
+    )
@@ -0,0 +1,281 @@
+import asyncio
+import importlib.util
+import logging
+import multiprocessing
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from PIL import Image
+
+import config
+from render_pyramid import build_derivatives
+from telemetry import QUEUE_DEPTH, STAGE_SECONDS, current_route
+
+log = logging.getLogger(__name__)
+
+
+class Backend:
+    name = ""
+    module = ""
+
+    def available(self):
+        return importlib.util.find_spec(self.module) is not None
+
+
+class PdfiumBackend(Backend):
+    """pypdfium2: renders straight into a bitmap in process"""
+
+    name = "pdfium"
+    module = "pypdfium2"
+    # pdfium is not thread-safe; this only matters when pages are rendered on threads (RASTER_WORKERS=0)
+    _lock = threading.Lock()
+
+    def page_count(self, path: Path) -> int:
+        import pypdfium2 as pdfium
+
+        with self._lock:
+            pdf = pdfium.PdfDocument(path)
+            try:
+                return len(pdf)
+            finally:
+                pdf.close()
+
+    def render(self, path: Path, page: int, dpi: int) -> Image.Image:
+        import pypdfium2 as pdfium
+
+        with self._lock:
+            pdf = pdfium.PdfDocument(path)
+            try:
+                # Draw form widgets (the empty boxes the user fills in) like poppler does
+                pdf.init_forms()
+                bitmap = pdf[page - 1].render(scale=dpi / 72, may_draw_forms=True)
+                return bitmap.to_pil().convert("RGB")
+            finally:
+                pdf.close()
+
+
+class PyMuPDFBackend(Backend):
+    """PyMuPDF: renders into a pixmap in process"""
+
+    name = "pymupdf"
+    module = "fitz"
+
+    def page_count(self, path: Path) -> int:
+        import fitz
+
+        with fitz.open(path) as doc:
+            return doc.page_count
+
+    def render(self, path: Path, page: int, dpi: int) -> Image.Image:
+        import fitz
+
+        with fitz.open(path) as doc:
+            pix = doc[page - 1].get_pixmap(dpi=dpi, alpha=False)
+            return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+
+class PopplerBackend(Backend):
+    """pdf2image: runs poppler's pdfinfo/pdftoppm as subprocesses and reads their output files back"""
+
+    name = "poppler"
+    module = "pdf2image"
+
+    def available(self):
+        return super().available() and shutil.which("pdftoppm") is not None
+
+    def page_count(self, path: Path) -> int:
+        from pdf2image import pdfinfo_from_path
+
+        return int(pdfinfo_from_path(path)["Pages"])
+
+    def render(self, path: Path, page: int, dpi: int) -> Image.Image:
+        from pdf2image import convert_from_path
+
+        return convert_from_path(path, dpi=dpi, first_page=page, last_page=page)[0].convert("RGB")
+
+
+BACKENDS = {backend.name: backend for backend in (PdfiumBackend, PyMuPDFBackend, PopplerBackend)}
+
+
+def backends(names=None) -> list:
+    """Installed backends named in `names` (default RASTERIZER_BACKENDS), in that order"""
+    found = []
+    for name in names or config.RASTERIZER_BACKENDS:
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown rasterizer backend: {name}")
+        backend = BACKENDS[name]()
+        if backend.available():
+            found.append(backend)
+    if not found:
+        raise RuntimeError(f"No rasterizer backend installed out of {', '.join(names or config.RASTERIZER_BACKENDS)}")
+    return found
+
+
+def _first_success(operation: str, path: Path, *args, names=None):
+    """Run `operation` on each backend in turn until one succeeds; a later one may cope with a PDF an earlier one rejects"""
+    error = None
+    for backend in backends(names):
+        try:
+            return getattr(backend, operation)(path, *args)
+        except Exception as e:
+            log.warning("Rasterizer backend failed", extra={"backend": backend.name, "operation": operation, "error": str(e)})
+            error = e
+    raise error
+
+
+def count_pages(path: Path, names=None) -> int:
+    if path.suffix.lower() != ".pdf":
+        return 1
+    return _first_success("page_count", path, names=names)
+
+
+def rasterize(path: Path, page: int, dpi: int, names=None) -> Image.Image:
+    """One page of a PDF as an RGB image at `dpi`; other files are images already and are just decoded"""
+    if path.suffix.lower() != ".pdf":
+        return Image.open(path).convert("RGB")
+    return _first_success("render", path, page, dpi, names=names)
+
+
+class RenderedPage:
+    """What a pool process sends back: the page as raw RGB bytes, its manifest entries and per-stage timings"""
+
+    def __init__(self, size, data, entries, timings):
+        self.size = size
+        self.data = data
+        self.entries = entries
+        self.timings = timings
+
+    def image(self) -> Image.Image:
+        return Image.frombytes("RGB", self.size, self.data)
+
+
+@contextmanager
+def _timed(timings: dict, stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = time.perf_counter() - start
+
+
+def render_page_job(path: Path, page: int, output_path: Path, dpi: int) -> RenderedPage:
+    """
+    Rasterize one page, save it as PNG and write its preview derivatives.
+    Runs in a pool process, where spans would be recorded against the wrong
+    route, so stage timings are returned for the caller to record instead.
+    """
+    timings = {}
+    with _timed(timings, "rasterize"):
+        image = rasterize(path, page, dpi)
+    with _timed(timings, "png_write"):
+        image.save(output_path, "PNG")
+    with _timed(timings, "derivatives"):
+        entries = build_derivatives(image, output_path, page)
+    return RenderedPage(image.size, image.tobytes(), entries, timings)
+
+
+def _warm_up():
+    # Import the backends once per process, before the first real page
+    for backend in backends():
+        importlib.import_module(backend.module)
+
+
+def _spawn_executor(workers):
+    # Forking a process that runs an event loop and threads is unsafe; start clean interpreters
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+class RasterPool:
+    """
+    Renders pages on a fixed set of worker processes so rasterizing and PNG
+    encoding never hold the event loop (or the GIL other requests need), and
+    at most `workers` pages are rendered at once per server process however
+    many sessions are being built; the rest wait their turn here. With 0
+    workers pages are rendered on a thread of the server process instead.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = config.RASTER_WORKERS if workers is None else workers
+        self._executor = None
+        self._semaphore = None
+
+    async def start(self):
+        """Start every worker process up front so the first upload does not pay for it"""
+        if not self.workers or self._executor is not None:
+            return
+        self._executor = _spawn_executor(self.workers)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _warm_up) for _ in range(self.workers)))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        self._semaphore = None
+
+    @asynccontextmanager
+    async def _slot(self):
+        """Hold one of the `workers` render slots, reporting waiting and in-flight pages"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(max(1, self.workers))
+        waiting = QUEUE_DEPTH.labels("raster_waiting")
+        waiting.inc()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            waiting.dec()
+        in_flight = QUEUE_DEPTH.labels("raster_in_flight")
+        in_flight.inc()
+        try:
+            yield
+        finally:
+            in_flight.dec()
+            self._semaphore.release()
+
+    def _discard(self, executor):
+        """Drop a broken executor; the next call starts a fresh one (other callers may have done so already)"""
+        if self._executor is executor:
+            self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, fn, *args):
+        async with self._slot():
+            if not self.workers:
+                return await asyncio.to_thread(fn, *args)
+            if self._executor is None:
+                await self.start()
+            executor = self._executor
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                # A worker that dies (a crash in a native renderer, the OOM killer)
+                # breaks the whole executor and every page in flight on it
+                log.warning("Raster worker process died, restarting the pool")
+                self._discard(executor)
+            # Retry once in a process of its own, so a page that kills its worker
+            # again fails alone instead of taking the new pool down with it
+            isolated = _spawn_executor(1)
+            try:
+                return await loop.run_in_executor(isolated, fn, *args)
+            finally:
+                isolated.shutdown(wait=False)
+
+    async def count_pages(self, path: Path) -> int:
+        # Opening a document is cheap next to rendering it; no need for a round trip to the pool
+        return await asyncio.to_thread(count_pages, path)
+
+    async def render_page(self, path: Path, page: int, output_path: Path, dpi: int) -> RenderedPage:
+        rendered = await self._run(render_page_job, path, page, output_path, dpi)
+        route = current_route.get()
+        for stage, seconds in rendered.timings.items():
+            STAGE_SECONDS.labels(route, stage).observe(seconds)
+        return rendered
+
+
+# One pool per server process, shared by every request and the job pool
+raster_pool = RasterPool()
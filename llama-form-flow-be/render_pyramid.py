@@ -0,0 +1,99 @@
+import hashlib
+import json
+from pathlib import Path
+from PIL import Image
+
+import config
+
+MEDIA_TYPES = {"png": "image/png", "webp": "image/webp", "jpeg": "image/jpeg"}
+MANIFEST_NAME = "renders.json"
+
+
+def _file_etag(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def build_derivatives(image, page_path: Path, page: int) -> list[dict]:
+    """
+    Write smaller WebP/JPEG copies of a rendered page next to its PNG.
+    Returns manifest entries for the PNG and every derivative.
+    """
+    entries = [{
+        "page": page,
+        "width": image.size[0],
+        "height": image.size[1],
+        "format": "png",
+        "file": page_path.name,
+        "etag": _file_etag(page_path),
+    }]
+    for width in sorted(set(config.RENDER_WIDTHS)):
+        if width >= image.size[0]:
+            continue
+        height = round(image.size[1] * width / image.size[0])
+        resized = image.resize((width, height), Image.LANCZOS)
+        if resized.mode not in ("RGB", "L"):
+            resized = resized.convert("RGB")
+        for fmt in config.RENDER_FORMATS:
+            path = page_path.with_name(f"{page_path.stem}-{width}.{fmt}")
+            resized.save(path, format=fmt.upper(), quality=config.RENDER_QUALITY)
+            entries.append({
+                "page": page,
+                "width": width,
+                "height": height,
+                "format": fmt,
+                "file": path.name,
+                "etag": _file_etag(path),
+            })
+    return entries
+
+
+def write_manifest(session_dir: Path, entries: list[dict]):
+    with open(session_dir / MANIFEST_NAME, "w") as f:
+        json.dump(sorted(entries, key=lambda e: (e["page"], e["width"], e["format"])), f)
+
+
+def load_manifest(session_dir: Path) -> list[dict] | None:
+    try:
+        with open(session_dir / MANIFEST_NAME) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def pick_derivative(entries: list[dict], page: int, width: int | None = None, format: str | None = None) -> dict | None:
+    """
+    Smallest render of the page at least `width` wide in the requested format,
+    falling back to the largest one available. Without a width the full PNG is used.
+    """
+    candidates = [e for e in entries if e["page"] == page]
+    if width is None and format is None:
+        candidates = [e for e in candidates if e["format"] == "png"]
+    elif format:
+        candidates = [e for e in candidates if e["format"] == format] or [e for e in candidates if e["format"] == "png"]
+    if not candidates:
+        return None
+    if width is None:
+        return max(candidates, key=lambda e: e["width"])
+    wide_enough = [e for e in candidates if e["width"] >= width]
+    if wide_enough:
+        return min(wide_enough, key=lambda e: e["width"])
+    return max(candidates, key=lambda e: e["width"])
+
+
+def scale_boxes(fields: list[dict], page: int, source_width: int, width: int) -> list[dict]:
+    """Bounding boxes of a page's fields in the pixel space of a `width`-wide render"""
+    scale = width / source_width if source_width else 1.0
+    boxes = []
+    for field in fields:
+        if field.get("page", 1) != page:
+            continue
+        box = field.get("bounding_box") or [0, 0, 0, 0]
+        boxes.append({
+            "inputfield": field.get("inputfield"),
+            "bounding_box": [round(float(v) * scale) for v in box[:4]],
+        })
+    return boxes
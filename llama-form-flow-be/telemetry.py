@@ -0,0 +1,179 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+import config
+
+log = logging.getLogger(__name__)
+
+# Route of the request (or "job" for the background pool) that spans are booked to
+current_route = contextvars.ContextVar("current_route", default="none")
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+REQUEST_SECONDS = Histogram(
+    "formflow_request_seconds", "HTTP request latency", ["route", "method", "status"], buckets=STAGE_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "formflow_stage_seconds", "Latency of one pipeline stage", ["route", "stage"], buckets=STAGE_BUCKETS,
+)
+LLM_SECONDS = Histogram(
+    "formflow_llm_seconds", "LLM call latency including retries", ["call_type"], buckets=LLM_BUCKETS,
+)
+LLM_TOKENS = Counter("formflow_llm_tokens", "LLM tokens", ["call_type", "kind"])
+LLM_CALLS = Counter("formflow_llm_calls", "LLM calls by outcome", ["call_type", "outcome"])
+DB_QUERY_SECONDS = Histogram(
+    "formflow_db_query_seconds", "Database statement latency", ["operation"], buckets=DB_BUCKETS,
+)
+QUEUE_DEPTH = Gauge(
+    "formflow_queue_depth", "Work waiting or in flight", ["queue"], multiprocess_mode="livesum",
+)
+EVENT_LOOP_LAG = Histogram(
+    "formflow_event_loop_lag_seconds", "How late the event loop runs a scheduled wake-up", buckets=LAG_BUCKETS,
+)
+ANSWER_VALIDATIONS = Counter("formflow_answer_validations", "Answers validated, by method", ["method"])
+SESSION_CACHE_LOOKUPS = Counter("formflow_session_cache_lookups", "Session cache lookups by outcome", ["outcome"])
+SESSION_CACHE_ENTRIES = Gauge(
+    "formflow_session_cache_entries", "Sessions cached in memory", multiprocess_mode="livesum",
+)
+TEMPLATE_LOOKUPS = Counter("formflow_template_lookups", "Template index lookups by outcome", ["outcome"])
+# Every worker indexes the same template directory
+TEMPLATES = Gauge("formflow_templates", "Templates indexed", multiprocess_mode="livemax")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the `extra` fields of the record as keys"""
+
+    _reserved = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update((k, v) for k, v in vars(record).items() if k not in self._reserved)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    handler = logging.StreamHandler()
+    if config.LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(config.LOG_LEVEL.upper())
+    # Every LLM request is already counted in formflow_llm_calls
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+@contextmanager
+def span(stage):
+    """Time a block as `stage` of the current route; works in threads started with asyncio.to_thread"""
+    route = current_route.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(route, stage).observe(elapsed)
+        log.debug("span", extra={"route": route, "stage": stage, "duration_ms": round(elapsed * 1000, 2)})
+
+
+async def monitor_event_loop(interval):
+    """
+    Sleep `interval` seconds at a time and record how much later than that the
+    loop got back to us; blocking work on the loop (CPU-bound code, sync I/O)
+    shows up here before it shows up in request latency.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - start - interval))
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request by its route template and
+    exposing the route to spans further down (streamed bodies included).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+        # No route takes path parameters, so the path is the route template
+        token = current_route.set(scope["path"])
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            # Unmatched paths share one label so scanners cannot blow up the series count
+            label = route.path if route is not None else "unmatched"
+            REQUEST_SECONDS.labels(label, scope["method"], str(status)).observe(time.perf_counter() - start)
+            current_route.reset(token)
+
+
+def _registry():
+    """Every gunicorn worker's metrics when PROMETHEUS_MULTIPROC_DIR is set, else this process's"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def render_metrics():
+    """Prometheus exposition text; merges every gunicorn worker when PROMETHEUS_MULTIPROC_DIR is set"""
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+def metric_totals(name, label=None):
+    """
+    Value of the counter or gauge `name` over every gunicorn worker, or with
+    `label` a dict of those values by that label's value.
+    """
+    totals = {}
+    for metric in _registry().collect():
+        if metric.name != name:
+            continue
+        for sample in metric.samples:
+            if sample.name in (name, f"{name}_total"):
+                key = sample.labels.get(label)
+                totals[key] = totals.get(key, 0) + sample.value
+    return totals if label else totals.get(None, 0)
@@ -0,0 +1,212 @@
+import copy
+import json
+import os
+import threading
+import uuid
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import config
+from telemetry import TEMPLATE_LOOKUPS, TEMPLATES, metric_totals
+
+# pHash over the 16x16 lowest DCT frequencies of a 64x64 thumbnail
+HASH_SIZE = 16
+HASH_BITS = HASH_SIZE * HASH_SIZE
+# LSH: the hash is split into bands; sharing any band makes a candidate
+BAND_BITS = 8
+# Templates and scans are aligned at this size
+ALIGN_MAX_EDGE = 1200
+ORB_FEATURES = 3000
+
+
+def page_fingerprint(gray):
+    """Perceptual hash of a grayscale page as a packed bit array"""
+    thumb = cv2.resize(gray, (HASH_SIZE * 4, HASH_SIZE * 4), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(thumb)[:HASH_SIZE, :HASH_SIZE].flatten()
+    return np.packbits(low > np.median(low[1:]))
+
+
+def _hamming(a, b):
+    return int(np.unpackbits(a ^ b).sum())
+
+
+def _bands(fingerprint):
+    step = BAND_BITS // 8
+    return [(i, fingerprint[i * step:(i + 1) * step].tobytes()) for i in range(len(fingerprint) // step)]
+
+
+def _working_image(image):
+    """Grayscale copy shrunk to ALIGN_MAX_EDGE, with the scale applied"""
+    gray = np.asarray(image.convert("L"))
+    scale = min(1.0, ALIGN_MAX_EDGE / max(gray.shape))
+    if scale < 1.0:
+        gray = cv2.resize(gray, (round(gray.shape[1] * scale), round(gray.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+    return gray, scale
+
+
+def _map_box(box, matrix):
+    x, y, w, h = (float(v) for v in box[:4])
+    corners = np.array([[x, y, 1], [x + w, y, 1], [x, y + h, 1], [x + w, y + h, 1]])
+    mapped = corners @ matrix.T
+    x1, y1 = mapped.min(axis=0)
+    x2, y2 = mapped.max(axis=0)
+    return [int(round(x1)), int(round(y1)), int(round(x2 - x1)), int(round(y2 - y1))]
+
+
+class TemplateIndex:
+    """
+    Registry of previously extracted pages, looked up by appearance.
+
+    Every extracted page is stored as a template: its perceptual hash, a
+    downscaled reference image and the field list, as files in template_dir so
+    templates are shared between workers and survive restarts. match() finds
+    templates whose hash is within max_distance bits through LSH buckets,
+    estimates an affine transform from the template to the new scan with ORB
+    features and RANSAC, and returns the template's fields moved onto the scan.
+    Templates are namespaced like the extraction cache, so a different model
+    or vision setting never reuses them.
+    """
+
+    def __init__(self, template_dir=None, max_distance=None, min_inliers=None, max_templates=None):
+        self.template_dir = Path(template_dir or config.TEMPLATE_INDEX_DIR)
+        self.max_distance = config.TEMPLATE_MAX_DISTANCE if max_distance is None else max_distance
+        self.min_inliers = min_inliers or config.TEMPLATE_MIN_INLIERS
+        self.max_templates = max_templates or config.TEMPLATE_MAX_ENTRIES
+        self.template_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._templates = {}  # id -> metadata without fields
+        self._buckets = {}  # (namespace, band index, band bytes) -> set of ids
+
+    def _index(self, template_id, meta):
+        self._templates[template_id] = meta
+        TEMPLATES.set(len(self._templates))
+        for band in _bands(meta["fingerprint"]):
+            self._buckets.setdefault((meta["namespace"],) + band, set()).add(template_id)
+
+    def _refresh(self):
+        """Pick up templates written by other workers"""
+        for path in self.template_dir.glob("*.json"):
+            if path.stem in self._templates:
+                continue
+            try:
+                data = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            self._index(path.stem, {
+                "namespace": data["namespace"],
+                "fingerprint": np.frombuffer(bytes.fromhex(data["fingerprint"]), dtype=np.uint8),
+                "scale": data["scale"],
+            })
+
+    def _candidates(self, namespace, fingerprint):
+        ids = set()
+        for band in _bands(fingerprint):
+            ids |= self._buckets.get((namespace,) + band, set())
+        scored = sorted((_hamming(fingerprint, self._templates[i]["fingerprint"]), i) for i in ids)
+        return [(distance, i) for distance, i in scored if distance <= self.max_distance]
+
+    def _align(self, template_id, gray):
+        """Affine transform from the template's reference image onto gray, or None"""
+        reference = cv2.imread(str(self.template_dir / f"{template_id}.png"), cv2.IMREAD_GRAYSCALE)
+        if reference is None:
+            return None
+        orb = cv2.ORB_create(ORB_FEATURES)
+        ref_points, ref_desc = orb.detectAndCompute(reference, None)
+        points, desc = orb.detectAndCompute(gray, None)
+        if ref_desc is None or desc is None or len(ref_points) < self.min_inliers or len(points) < self.min_inliers:
+            return None
+        matches = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True).match(ref_desc, desc)
+        if len(matches) < self.min_inliers:
+            return None
+        src = np.float32([ref_points[m.queryIdx].pt for m in matches])
+        dst = np.float32([points[m.trainIdx].pt for m in matches])
+        matrix, inliers = cv2.estimateAffine2D(src, dst, method=cv2.RANSAC, ransacReprojThreshold=3.0)
+        if matrix is None or int(inliers.sum()) < self.min_inliers:
+            return None
+        return matrix
+
+    def match(self, image, namespace):
+        """Fields of the closest template aligned onto image, or None when no template fits"""
+        gray, scale = _working_image(image)
+        fingerprint = page_fingerprint(gray)
+        with self._lock:
+            self._refresh()
+            candidates = self._candidates(namespace, fingerprint)
+
+        for _, template_id in candidates:
+            matrix = self._align(template_id, gray)
+            if matrix is None:
+                continue
+            try:
+                data = json.loads((self.template_dir / f"{template_id}.json").read_text())
+            except (OSError, ValueError):
+                continue
+            # Template source pixels -> reference image -> scan working image -> scan source pixels
+            ref_scale = self._templates[template_id]["scale"]
+            full = np.vstack([matrix, [0, 0, 1]])
+            full = np.diag([1 / scale, 1 / scale, 1]) @ full @ np.diag([ref_scale, ref_scale, 1])
+            fields = copy.deepcopy(data["fields"])
+            for field in fields:
+                box = field.get("bounding_box")
+                if isinstance(box, list) and len(box) >= 4:
+                    field["bounding_box"] = _map_box(box, full[:2])
+            TEMPLATE_LOOKUPS.labels("hit").inc()
+            return fields
+
+        TEMPLATE_LOOKUPS.labels("miss").inc()
+        return None
+
+    def add(self, image, namespace, fields):
+        """Register an extracted page as a template"""
+        gray, scale = _working_image(image)
+        fingerprint = page_fingerprint(gray)
+        template_id = uuid.uuid4().hex
+        data = {
+            "namespace": namespace,
+            "fingerprint": fingerprint.tobytes().hex(),
+            "scale": scale,
+            "fields": fields,
+        }
+        cv2.imwrite(str(self.template_dir / f"{template_id}.png"), gray)
+        path = self.template_dir / f"{template_id}.json"
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(data))
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._index(template_id, {
+                "namespace": namespace,
+                "fingerprint": fingerprint,
+                "scale": scale,
+            })
+        self._evict()
+        return template_id
+
+    def _evict(self):
+        files = []
+        for path in self.template_dir.glob("*.json"):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except OSError:
+                continue
+        files.sort()
+        while len(files) > self.max_templates:
+            _, path = files.pop(0)
+            path.unlink(missing_ok=True)
+            path.with_suffix(".png").unlink(missing_ok=True)
+            with self._lock:
+                meta = self._templates.pop(path.stem, None)
+                TEMPLATES.set(len(self._templates))
+                if meta:
+                    for band in _bands(meta["fingerprint"]):
+                        self._buckets.get((meta["namespace"],) + band, set()).discard(path.stem)
+
+    def stats(self):
+        """Totals over every gunicorn worker"""
+        lookups = metric_totals("formflow_template_lookups", "outcome")
+        return {
+            "templates": int(metric_totals("formflow_templates")),
+            "hits": int(lookups.get("hit", 0)),
+            "misses": int(lookups.get("miss", 0)),
+        }
@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import re
+import unicodedata
+from pathlib import Path
+
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+import config
+
+MAX_FILENAME_LENGTH = 100
+
+
+class UploadRejected(Exception):
+    """The upload is malformed or too large; status_code is the HTTP status to answer with"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class StoredUpload:
+    def __init__(self, path, size, sha256):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+
+def safe_filename(name):
+    """
+    A client-supplied filename reduced to something safe to join to a
+    directory: no path components, ASCII letters, digits, dot, dash and
+    underscore only, no leading dots, bounded length, extension kept.
+    """
+    name = re.split(r"[\\/]", name or "")[-1]
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", name).lstrip("._")
+    stem, dot, suffix = name.rpartition(".")
+    if not dot:
+        stem, suffix = name, ""
+    suffix = suffix[:10].lower()
+    stem = stem[:MAX_FILENAME_LENGTH - len(suffix) - 1] or "upload"
+    return f"{stem}.{suffix}" if suffix else stem
+
+
+class _FileWriter:
+    """Receives multipart callbacks; buffers the file part and flushes it in chunk_size blocks"""
+
+    def __init__(self, field_name, directory, max_bytes, chunk_size):
+        self.field_name = field_name
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.path = None
+        self.file = None
+        self.buffer = bytearray()
+        self._header_field = b""
+        self._headers = {}
+        self._writing = False
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+        self._header_field = b""
+
+    def on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        key = self._header_field.lower()
+        self._headers[key] = self._headers.get(key, b"") + data[start:end]
+
+    def on_header_end(self):
+        self._header_field = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("latin-1")
+        if name != self.field_name or b"filename" not in options or self.path is not None:
+            return
+        filename = options[b"filename"].decode("utf-8", "replace")
+        self.path = self.directory / safe_filename(filename)
+        self.file = open(self.path, "wb")
+        self._writing = True
+
+    def on_part_data(self, data, start, end):
+        if not self._writing:
+            return
+        self.size += end - start
+        if self.size > self.max_bytes:
+            raise UploadRejected(f"Upload is larger than {self.max_bytes} bytes", status_code=413)
+        self.buffer += data[start:end]
+
+    def on_part_end(self):
+        self._writing = False
+
+    def take_chunk(self, final=False):
+        """Bytes ready to be written: whole chunk_size blocks, or everything at the end"""
+        if not self.buffer or (not final and len(self.buffer) < self.chunk_size):
+            return b""
+        end = len(self.buffer) if final else len(self.buffer) - len(self.buffer) % self.chunk_size
+        chunk = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        return chunk
+
+    def write(self, chunk):
+        self.digest.update(chunk)
+        self.file.write(chunk)
+
+    def discard(self):
+        """Close and delete a partially written file"""
+        if self.file is not None:
+            self.file.close()
+            self.path.unlink(missing_ok=True)
+
+
+async def receive_upload(request, directory: Path, field_name="file", max_bytes=None, chunk_size=None) -> StoredUpload:
+    """
+    Stream the file part `field_name` of a multipart request body into
+    `directory`, hashing it in the same pass. Memory use is bounded by
+    chunk_size whatever the size of the upload: the body is parsed as it
+    arrives and written out in chunk_size blocks from a worker thread.
+    Requests whose Content-Length already exceeds max_bytes are rejected
+    before any of the body is read, others as soon as the file part does.
+    """
+    max_bytes = max_bytes or config.UPLOAD_MAX_BYTES
+    chunk_size = chunk_size or config.UPLOAD_CHUNK_SIZE
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadRejected("Expected a multipart/form-data upload")
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes + 64 * 1024:
+        raise UploadRejected(f"Upload is larger than {max_bytes} bytes", status_code=413)
+
+    writer = _FileWriter(field_name, directory, max_bytes, chunk_size)
+    parser = MultipartParser(params[b"boundary"], writer.callbacks())
+    try:
+        async for data in request.stream():
+            parser.write(data)
+            chunk = writer.take_chunk()
+            if chunk:
+                await asyncio.to_thread(writer.write, chunk)
+        parser.finalize()
+        if writer.file is None:
+            raise UploadRejected(f'No file in form field "{field_name}"')
+        chunk = writer.take_chunk(final=True)
+        if chunk:
+            await asyncio.to_thread(writer.write, chunk)
+    except MultipartParseError as e:
+        writer.discard()
+        raise UploadRejected(f"Malformed multipart body: {e}") from e
+    except Exception:
+        writer.discard()
+        raise
+    writer.file.close()
+    return StoredUpload(writer.path, writer.size, writer.digest.hexdigest())
+